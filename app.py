@@ -19,8 +19,11 @@ from csv_provider.configuration import conf
 from csv_provider import handlers
 from csv_provider import api
 from csv_provider import util
+from csv_provider import asgi
 import auth_client
 import falcon
+import falcon.asgi
+import concurrent.futures
 
 
 initLogger(conf.Logger.level)
@@ -33,9 +36,24 @@ auth_handler = auth_client.Client(
     client_id=conf.Auth.client_id,
     user_id=conf.Auth.user_id
 )
-db_handler = handlers.DB(st_path=conf.Storage.db_path)
-data_handler = handlers.Data(
+upstream_handler = handlers.Upstream(
     auth_handler=auth_handler,
+    usr_id=conf.Auth.user_id,
+    pool_size=conf.Data.fetch_workers,
+    retries=conf.Data.retries,
+    backoff=conf.Data.backoff,
+    backoff_max=conf.Data.backoff_max,
+    token_ttl=conf.Auth.token_ttl,
+    connect_timeout=conf.Data.connect_timeout,
+    read_timeout=conf.Data.read_timeout,
+    limiter=handlers.Limiter(
+        concurrency=conf.Data.upstream_concurrency,
+        rate=conf.Data.upstream_rate,
+        latency=conf.Data.upstream_latency
+    )
+)
+data_handler = handlers.Data(
+    upstream_handler=upstream_handler,
     data_path=conf.Storage.data_path,
     tmp_path=conf.Storage.tmp_path,
     db_api_url=conf.Data.db_api_url,
@@ -44,31 +62,66 @@ data_handler = handlers.Data(
     db_api_time_format=conf.Data.db_api_time_format,
     start_year=conf.Data.start_year,
     chunk_size=conf.Data.chunk_size,
-    usr_id=conf.Auth.user_id,
+    chunk_size_min=conf.Data.chunk_size_min,
+    chunk_size_max=conf.Data.chunk_size_max,
+    page_seconds=conf.Data.page_seconds,
+    page_bytes=conf.Data.page_bytes,
+    file_rows=conf.Data.file_rows,
+    file_size=conf.Data.file_size,
+    file_period=conf.Data.file_period,
     compression=conf.Data.compression,
-    single_header=conf.Data.single_header
+    codec=conf.Data.codec,
+    compression_level=conf.Data.compression_level,
+    compression_threads=conf.Data.compression_threads,
+    single_header=conf.Data.single_header,
+    fetch_workers=conf.Data.fetch_workers,
+    fetch_buffer=conf.Data.fetch_buffer,
+    fetch_batch=conf.Data.fetch_batch,
+    render_workers=conf.Data.render_workers,
+    float_precision=conf.Data.float_precision,
+    index_interval=conf.Data.index_interval
 )
+worker_pool = handlers.WorkerPool(
+    data_handler=data_handler,
+    size=conf.Jobs.max_num,
+    max_jobs=conf.Jobs.worker_max_jobs,
+    max_rss=conf.Jobs.worker_max_rss,
+    progress_interval=conf.Jobs.progress_interval
+)
+worker_pool.start()
+db_handler = handlers.DB(st_path=conf.Storage.db_path)
+data_cache = handlers.DataCache(db_handler=db_handler, size=conf.Api.data_cache_size)
 jobs_handler = handlers.Jobs(
     db_handler=db_handler,
-    data_handler=data_handler,
+    worker_pool=worker_pool,
     check_delay=conf.Jobs.check,
     max_jobs=conf.Jobs.max_num
 )
 
-app = falcon.API()
+app = falcon.App(middleware=[api.MetricsMiddleware()])
 
 app.req_options.strip_url_path_trailing_slash = True
 
+asgi_app = falcon.asgi.App(middleware=[api.MetricsMiddleware()])
+
+asgi_app.req_options.strip_url_path_trailing_slash = True
+
+asgi_executor = concurrent.futures.ThreadPoolExecutor(max_workers=conf.Api.io_threads, thread_name_prefix="asgi-io")
+
 routes = (
     ("/data", api.DataCollection(db_handler=db_handler)),
-    ("/data/{source_id}", api.DataResource(db_handler=db_handler, data_handler=data_handler)),
-    ("/data/{source_id}/files/{file}", api.CSV(db_handler=db_handler, data_handler=data_handler)),
+    ("/data/{source_id}", api.DataResource(db_handler=db_handler, data_handler=data_handler, data_cache=data_cache)),
+    ("/data/{source_id}/files/{file}", api.CSV(data_cache=data_cache, data_handler=data_handler, max_age=conf.Api.max_age)),
+    ("/data/{source_id}/csv", api.CSVStream(data_cache=data_cache, data_handler=data_handler)),
+    ("/data/{source_id}/query", api.Query(data_cache=data_cache, data_handler=data_handler)),
     ("/jobs", api.Jobs(db_handler=db_handler, jobs_handler=jobs_handler)),
-    ("/jobs/{job_id}", api.Job(db_handler=db_handler, jobs_handler=jobs_handler))
+    ("/jobs/{job_id}", api.Job(db_handler=db_handler, jobs_handler=jobs_handler)),
+    ("/metrics", api.Metrics())
 )
 
-for route in routes:
-    app.add_route(*route)
+for route, resource in routes:
+    app.add_route(route, resource)
+    asgi_app.add_route(route, asgi.Resource(resource=resource, executor=asgi_executor, chunk_size=conf.Api.stream_chunk_size))
 
 data_handler.purge_tmp()
 jobs_handler.start()
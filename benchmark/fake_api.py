@@ -0,0 +1,141 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("Source", "FakeAPI")
+
+
+import http.server
+import urllib.parse
+import threading
+import datetime
+import random
+import json
+import typing
+
+
+time_format = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def parse_time(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(timestamp.rstrip("Z"))
+
+
+class Source:
+    def __init__(self, source_id: str, measurement: str, rows: int, columns: int, sparsity: float, interval: int = 60, start: datetime.datetime = datetime.datetime(2020, 1, 1), seed: int = 0, variants: int = 4096):
+        self.source_id = source_id
+        self.measurement = measurement
+        self.rows = rows
+        self.columns = columns
+        self.sparsity = sparsity
+        self.interval = datetime.timedelta(seconds=interval)
+        self.start = start
+        self.default_values = json.dumps({"c{}".format(x): 0 for x in range(0, columns, 5)})
+        rng = random.Random(seed)
+        self.__variants = [self.__gen_data(rng) for _ in range(variants)]
+
+    def __gen_data(self, rng: random.Random) -> str:
+        data = dict()
+        for x in range(self.columns):
+            if rng.random() < self.sparsity:
+                continue
+            kind = x % 4
+            if kind == 0:
+                data["c{}".format(x)] = rng.uniform(-1000, 1000)
+            elif kind == 1:
+                data["c{}".format(x)] = rng.randint(0, 100000)
+            elif kind == 2:
+                data["c{}".format(x)] = rng.random() < 0.5
+            else:
+                data["c{}".format(x)] = "s{}".format(rng.randint(0, 999))
+        return json.dumps(data)
+
+    def timestamp(self, index: int) -> datetime.datetime:
+        return self.start + self.interval * index
+
+    def row(self, index: int) -> list:
+        return [self.timestamp(index).strftime(time_format), self.__variants[index % len(self.__variants)], self.default_values]
+
+    def first_after(self, timestamp: datetime.datetime) -> int:
+        if timestamp < self.start:
+            return 0
+        return (timestamp - self.start) // self.interval + 1
+
+    def last_before(self, timestamp: datetime.datetime) -> int:
+        if timestamp <= self.start:
+            return -1
+        quotient, remainder = divmod(timestamp - self.start, self.interval)
+        return quotient if remainder else quotient - 1
+
+    def query(self, descending: bool, limit: typing.Optional[int], start: typing.Optional[datetime.datetime], end: typing.Optional[datetime.datetime]) -> list:
+        first = self.first_after(start) if start else 0
+        last = min(self.last_before(end) if end else self.rows - 1, self.rows - 1)
+        indices = range(last, first - 1, -1) if descending else range(first, last + 1)
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.row(index) for index in indices]
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def __respond(self, body: typing.Any):
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.__respond({"instances": [{"Description": source.source_id, "Measurement": source.measurement} for source in self.server.sources.values()]})
+
+    def do_POST(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))[0]
+        time_range = query.get("time") or dict()
+        self.__respond(
+            self.server.sources[query["measurement"]].query(
+                descending=params.get("order_direction", ["asc"])[0] == "desc",
+                limit=query.get("limit"),
+                start=parse_time(time_range["start"]) if time_range.get("start") else None,
+                end=parse_time(time_range["end"]) if time_range.get("end") else None
+            )
+        )
+
+
+class FakeAPI:
+    def __init__(self, sources: typing.Iterable[Source]):
+        self.__server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__server.daemon_threads = True
+        self.__server.sources = {source.measurement: source for source in sources}
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="fake-api", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.__server.server_address[1])
+
+    def add(self, source: Source):
+        self.__server.sources[source.measurement] = source
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
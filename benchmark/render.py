@@ -0,0 +1,101 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider.configuration import conf
+from csv_provider.handlers.data import RowRenderer
+from csv_provider import util
+from benchmark.fake_api import Source
+import argparse
+import json
+import time
+import io
+
+
+def render_dict_lookup(data: list, columns: list, default_values: dict, delimiter: str) -> bytes:
+    line_map = dict()
+    for x in range(len(columns)):
+        line_map[x] = columns[x]
+    _range = range(len(columns))
+    _line = list()
+    lines = list()
+    for line in data:
+        for x in _range:
+            try:
+                value = str(line[line_map[x]])
+            except KeyError:
+                try:
+                    value = str(default_values[line_map[x]])
+                except KeyError:
+                    value = str()
+            _line.append(value)
+        lines.append("{}\n".format(delimiter.join(_line)).encode())
+        _line.clear()
+    return b"".join(lines)
+
+
+def render_positional(spill: bytes, columns: list, default_values: dict, delimiter: str) -> bytes:
+    renderer = RowRenderer(columns=columns, default_values=default_values, delimiter=delimiter, float_precision=conf.Data.float_precision, empty_defaults=False)
+    lines = list()
+    for spill_columns, layouts, rows in util.read_spill(io.BytesIO(spill)):
+        renderer.set_layouts(spill_columns, layouts)
+        lines.append(renderer.render(rows))
+    return b"".join(lines)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dict lookup CSV loop with the positional row renderer.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=120)
+    parser.add_argument("--sparsity", type=float, default=0.7, help="probability of a column missing in a row")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant, the fastest is reported")
+    args = parser.parse_args()
+    source = Source(source_id="benchmark", measurement="m", rows=args.rows, columns=args.columns, sparsity=args.sparsity)
+    items = [source.row(x) for x in range(args.rows)]
+    default_values = json.loads(source.default_values)
+    columns = set()
+    data = list()
+    spill = io.BytesIO()
+    writer = util.SpillWriter(spill)
+    for item in items:
+        line = json.loads(item[1])
+        columns.update(line.keys())
+        writer.write(item[0], line)
+        line["time"] = item[0]
+        data.append(line)
+    writer.flush()
+    columns = ["time", *sorted(columns)]
+    spill = spill.getvalue()
+    results = (
+        ("dict lookup", best_of(args.repeat, render_dict_lookup, data, columns, default_values, ",")),
+        ("positional", best_of(args.repeat, render_positional, spill, columns, default_values, ","))
+    )
+    print("{:>12} {:>10} {:>12}".format("loop", "seconds", "rows/s"))
+    for name, seconds in results:
+        print("{:>12} {:>10.3f} {:>12.1f}".format(name, seconds, args.rows / seconds))
+    print("speedup: {:.2f}x".format(results[0][1] / results[1][1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider.configuration import conf
+from csv_provider import handlers, models
+from benchmark.fake_api import Source, FakeAPI
+import multiprocessing
+import itertools
+import threading
+import argparse
+import tempfile
+import resource
+import shutil
+import json
+import time
+import os
+
+
+class StaticAuth:
+    def get_access_token(self) -> str:
+        return "benchmark"
+
+
+def get_dir_size(path: str) -> int:
+    size = 0
+    for entry in os.scandir(path):
+        try:
+            size += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+    return size
+
+
+def build(url: str, chunk_size: int, codec: str, file_format: str, args: argparse.Namespace) -> dict:
+    base_path = tempfile.mkdtemp(prefix="csv-provider-benchmark-")
+    data_path = os.path.join(base_path, "data")
+    tmp_path = os.path.join(base_path, "tmp")
+    os.makedirs(data_path)
+    os.makedirs(tmp_path)
+    upstream_handler = handlers.Upstream(
+        auth_handler=StaticAuth(),
+        usr_id="benchmark",
+        pool_size=args.fetch_workers,
+        retries=conf.Data.retries,
+        backoff=conf.Data.backoff,
+        backoff_max=conf.Data.backoff_max,
+        token_ttl=conf.Auth.token_ttl,
+        connect_timeout=conf.Data.connect_timeout,
+        read_timeout=conf.Data.read_timeout,
+        limiter=handlers.Limiter(
+            concurrency=conf.Data.upstream_concurrency,
+            rate=conf.Data.upstream_rate,
+            latency=conf.Data.upstream_latency
+        )
+    )
+    data_handler = handlers.Data(
+        upstream_handler=upstream_handler,
+        data_path=data_path,
+        tmp_path=tmp_path,
+        db_api_url=url,
+        export_api_url=url,
+        time_format=conf.Data.time_format,
+        db_api_time_format=conf.Data.db_api_time_format,
+        start_year=conf.Data.start_year,
+        chunk_size=chunk_size,
+        chunk_size_min=conf.Data.chunk_size_min,
+        chunk_size_max=conf.Data.chunk_size_max,
+        page_seconds=conf.Data.page_seconds,
+        page_bytes=conf.Data.page_bytes,
+        file_rows=conf.Data.file_rows,
+        file_size=conf.Data.file_size,
+        file_period=conf.Data.file_period,
+        compression=codec != "none",
+        codec=codec if codec != "none" else conf.Data.codec,
+        compression_level=conf.Data.compression_level,
+        compression_threads=conf.Data.compression_threads,
+        single_header=conf.Data.single_header,
+        fetch_workers=args.fetch_workers,
+        fetch_buffer=conf.Data.fetch_buffer,
+        fetch_batch=conf.Data.fetch_batch,
+        render_workers=args.render_workers,
+        float_precision=conf.Data.float_precision,
+        index_interval=conf.Data.index_interval
+    )
+    request = models.DataItem()
+    request.source_id = "benchmark"
+    request.time_field = "time"
+    request.delimiter = ","
+    request.format = file_format
+    peak_tmp = 0
+    stop = threading.Event()
+
+    def monitor():
+        nonlocal peak_tmp
+        while not stop.wait(0.05):
+            peak_tmp = max(peak_tmp, get_dir_size(tmp_path))
+
+    thread = threading.Thread(target=monitor, daemon=True)
+    thread.start()
+    try:
+        start = time.perf_counter()
+        data_item = data_handler.create(request)
+        seconds = time.perf_counter() - start
+    finally:
+        stop.set()
+        thread.join()
+    output_bytes = get_dir_size(data_path)
+    shutil.rmtree(base_path, ignore_errors=True)
+    return dict(
+        chunk_size=chunk_size,
+        codec=codec,
+        format=file_format,
+        rows=data_item.size,
+        files=len(data_item.files),
+        seconds=round(seconds, 3),
+        rows_per_second=round(data_item.size / seconds, 1),
+        peak_rss_mb=round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024, 1),
+        peak_tmp_mb=round(peak_tmp / 1024 / 1024, 2),
+        output_mb=round(output_bytes / 1024 / 1024, 2),
+        upstream=upstream_handler.get_stats()
+    )
+
+
+def run_build(conn, *args):
+    try:
+        conn.send(build(*args))
+    except Exception as ex:
+        conn.send(dict(error=str(ex)))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data builds against a local stand-in of the DB and export API.")
+    parser.add_argument("--sources", type=int, default=2, help="number of sources (measurements)")
+    parser.add_argument("--rows", type=int, default=100000, help="rows per source")
+    parser.add_argument("--columns", type=int, default=20, help="columns per source")
+    parser.add_argument("--sparsity", type=float, default=0.3, help="probability of a column missing in a row")
+    parser.add_argument("--chunk-sizes", default="10000", help="comma separated chunk sizes")
+    parser.add_argument("--codecs", default="none,gzip", help="comma separated codecs, 'none' disables compression")
+    parser.add_argument("--formats", default="csv", help="comma separated output formats")
+    parser.add_argument("--fetch-workers", type=int, default=conf.Data.fetch_workers)
+    parser.add_argument("--render-workers", type=int, default=conf.Data.render_workers)
+    parser.add_argument("--repeat", type=int, default=1, help="builds per configuration")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    api = FakeAPI(
+        Source(source_id="benchmark", measurement="m{}".format(x), rows=args.rows, columns=args.columns, sparsity=args.sparsity, seed=x)
+        for x in range(args.sources)
+    )
+    api.start()
+    results = list()
+    header = "{:>10} {:>6} {:>8} {:>10} {:>9} {:>12} {:>10} {:>10} {:>10}".format(
+        "chunk_size", "codec", "format", "rows", "seconds", "rows/s", "rss_mb", "tmp_mb", "output_mb"
+    )
+    print(header)
+    configurations = itertools.product(
+        (int(size) for size in args.chunk_sizes.split(",")),
+        args.codecs.split(","),
+        args.formats.split(",")
+    )
+    for chunk_size, codec, file_format in configurations:
+        for _ in range(args.repeat):
+            reader, writer = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_build, args=(writer, api.url, chunk_size, codec, file_format, args))
+            process.start()
+            writer.close()
+            result = reader.recv()
+            process.join()
+            if "error" in result:
+                print("{:>10} {:>6} {:>8} failed - {}".format(chunk_size, codec, file_format, result["error"]))
+                continue
+            results.append(result)
+            print("{chunk_size:>10} {codec:>6} {format:>8} {rows:>10} {seconds:>9} {rows_per_second:>12} {peak_rss_mb:>10} {peak_tmp_mb:>10} {output_mb:>10}".format(**result))
+    api.stop()
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(dict(arguments=vars(args), results=results), file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,19 +14,33 @@
    limitations under the License.
 """
 
-__all__ = ("DataCollection", "DataResource", "Jobs", "Job", "CSV")
+__all__ = ("DataCollection", "DataResource", "Jobs", "Job", "CSV", "CSVStream", "Query", "Metrics", "MetricsMiddleware")
 
 
 from .logger import getLogger
 from . import handlers
 from . import models
+from . import metrics
 import falcon
+import falcon.asgi
 import json
+import typing
+import hashlib
+import datetime
+import time
 
 
 logger = getLogger(__name__.split(".", 1)[-1])
 
 
+default_page_size = 1000
+
+content_types = {
+    models.FileFormat.parquet: "application/vnd.apache.parquet",
+    models.FileFormat.arrow: "application/vnd.apache.arrow.file"
+}
+
+
 def reqDebugLog(req):
     logger.debug("method='{}' path='{}' content_type='{}'".format(req.method, req.path, req.content_type))
 
@@ -35,6 +49,101 @@ def reqErrorLog(req, ex):
     logger.error("method='{}' path='{}' - {}".format(req.method, req.path, ex))
 
 
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def getRange(req: falcon.request.Request, size: int, etag: str) -> typing.Optional[typing.Tuple[int, int]]:
+    try:
+        if not req.range or req.range_unit != "bytes":
+            return None
+    except falcon.HTTPError:
+        return None
+    if req.get_header("If-Range") not in (None, '"{}"'.format(etag)):
+        return None
+    first, last = req.range
+    if first < 0:
+        first = max(size + first, 0)
+        last = size - 1
+    elif last < 0 or last >= size:
+        last = size - 1
+    if first > last:
+        raise RangeNotSatisfiable("range '{}' not satisfiable for size '{}'".format(req.get_header("Range"), size))
+    return first, last
+
+
+def parseTimestamp(timestamp: typing.Optional[str]) -> typing.Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ").replace(microsecond=0)
+    except (TypeError, ValueError):
+        return None
+
+
+def setCacheHeaders(resp: falcon.response.Response, etag: str, last_modified: typing.Optional[datetime.datetime], cache_control: str):
+    resp.etag = etag
+    resp.cache_control = [cache_control]
+    if last_modified:
+        resp.last_modified = last_modified
+
+
+def isNotModified(req: falcon.request.Request, etag: str, last_modified: typing.Optional[datetime.datetime]) -> bool:
+    if req.if_none_match:
+        return "*" in req.if_none_match or etag in req.if_none_match
+    if last_modified and req.if_modified_since:
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def setRangeNotSatisfiable(resp: falcon.response.Response, size: int):
+    resp.set_header("Content-Range", "bytes */{}".format(size))
+    resp.status = falcon.HTTP_416
+
+
+def getPage(req: falcon.request.Request) -> typing.Tuple[typing.Optional[int], typing.Optional[str]]:
+    limit = req.get_param("limit")
+    cursor = req.get_param("cursor")
+    if limit is None and cursor is None:
+        return None, None
+    try:
+        limit = int(limit) if limit is not None else default_page_size
+    except ValueError:
+        raise ValueError("invalid limit '{}'".format(limit))
+    if limit < 1:
+        raise ValueError("invalid limit '{}'".format(limit))
+    return limit, cursor
+
+
+def listKeys(req: falcon.request.Request, resp: falcon.response.Response, db_handler: handlers.DB, db: bytes) -> list:
+    limit, cursor = getPage(req)
+    if limit is None:
+        return db_handler.list_keys(db)
+    keys, next_cursor = db_handler.page_keys(db, limit, cursor)
+    if next_cursor:
+        resp.set_header("X-Next-Cursor", next_cursor)
+    return keys
+
+
+def listItems(req: falcon.request.Request, resp: falcon.response.Response, db_handler: handlers.DB, db: bytes) -> list:
+    limit, cursor = getPage(req)
+    if limit is None:
+        return db_handler.list_items(db)
+    items, next_cursor = db_handler.page_items(db, limit, cursor)
+    if next_cursor:
+        resp.set_header("X-Next-Cursor", next_cursor)
+    return items
+
+
+def getFields(req: falcon.request.Request) -> typing.Optional[list]:
+    fields = req.get_param_as_list("fields")
+    if fields is None:
+        return None
+    fields = [field for param in fields for field in param.split(",") if field]
+    for field in fields:
+        if field not in handlers.data_item_fields:
+            raise ValueError("unknown field '{}'".format(field))
+    return fields
+
+
 class DataCollection:
     def __init__(self, db_handler: handlers.DB):
         self.__db_handler = db_handler
@@ -42,9 +151,19 @@ class DataCollection:
     def on_get(self, req: falcon.request.Request, resp: falcon.response.Response):
         reqDebugLog(req)
         try:
+            expand = req.get_param("expand")
+            if expand is None:
+                body = listKeys(req, resp, self.__db_handler, b"data-")
+            elif expand == "summary":
+                body = [handlers.summarize_data_item(value) for _, value in listItems(req, resp, self.__db_handler, b"data-")]
+            else:
+                raise ValueError("unknown expansion '{}'".format(expand))
             resp.content_type = falcon.MEDIA_JSON
-            resp.body = json.dumps(self.__db_handler.list_keys(b"data-"))
+            resp.text = json.dumps(body)
             resp.status = falcon.HTTP_200
+        except ValueError as ex:
+            resp.status = falcon.HTTP_400
+            reqErrorLog(req, ex)
         except Exception as ex:
             resp.status = falcon.HTTP_500
             reqErrorLog(req, ex)
@@ -59,7 +178,20 @@ class DataCollection:
             except KeyError:
                 if not all((data_item.source_id, data_item.time_field, data_item.delimiter)):
                     raise ValueError("incomplete request")
-                self.__db_handler.put(b"data-", data_item.source_id.encode(), json.dumps(dict(data_item)).encode())
+                if data_item.format not in (models.FileFormat.csv, models.FileFormat.parquet, models.FileFormat.arrow):
+                    raise ValueError("unknown format '{}'".format(data_item.format))
+                if data_item.codec not in (None, models.Codec.gzip, models.Codec.zstd, models.Codec.lz4):
+                    raise ValueError("unknown codec '{}'".format(data_item.codec))
+                if data_item.compression_level is not None and not isinstance(data_item.compression_level, int):
+                    raise ValueError("invalid compression level '{}'".format(data_item.compression_level))
+                for field in ("file_rows", "file_size"):
+                    value = getattr(data_item, field)
+                    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                        raise ValueError("invalid {} '{}'".format(field.replace("_", " "), value))
+                if data_item.file_period not in (None, models.FilePeriod.hour, models.FilePeriod.day, models.FilePeriod.month, models.FilePeriod.year):
+                    raise ValueError("unknown file period '{}'".format(data_item.file_period))
+                with self.__db_handler.batch() as batch:
+                    handlers.store_data_item(batch, data_item)
                 resp.status = falcon.HTTP_201
         except ValueError as ex:
             resp.status = falcon.HTTP_400
@@ -70,16 +202,42 @@ class DataCollection:
 
 
 class DataResource:
-    def __init__(self, db_handler: handlers.DB, data_handler: handlers.Data):
+    def __init__(self, db_handler: handlers.DB, data_handler: handlers.Data, data_cache: handlers.DataCache):
         self.__db_handler = db_handler
         self.__data_handler = data_handler
+        self.__data_cache = data_cache
 
     def on_get(self, req: falcon.request.Request, resp: falcon.response.Response, source_id: str):
         reqDebugLog(req)
         try:
+            fields = getFields(req)
+            if fields is None:
+                item = self.__data_cache.get(source_id)
+                body, etag, created = item.body, item.etag, item.data_item.created
+            else:
+                item = self.__data_cache.peek(source_id)
+                if item:
+                    record = dict(item.data_item)
+                    record = {field: record[field] for field in fields}
+                    created = item.data_item.created
+                else:
+                    record = handlers.load_data_item(self.__db_handler, source_id, [*fields, "created"])
+                    created = record["created"]
+                    if "created" not in fields:
+                        del record["created"]
+                body = json.dumps(record).encode()
+                etag = hashlib.sha1(body).hexdigest()
+            last_modified = parseTimestamp(created)
+            setCacheHeaders(resp, etag, last_modified, "no-cache")
+            if isNotModified(req, etag, last_modified):
+                resp.status = falcon.HTTP_304
+                return
             resp.content_type = falcon.MEDIA_JSON
-            resp.body = self.__db_handler.get(b"data-", source_id.encode())
+            resp.data = body
             resp.status = falcon.HTTP_200
+        except ValueError as ex:
+            resp.status = falcon.HTTP_400
+            reqErrorLog(req, ex)
         except KeyError as ex:
             resp.status = falcon.HTTP_404
             reqErrorLog(req, ex)
@@ -90,8 +248,9 @@ class DataResource:
     def on_delete(self, req: falcon.request.Request, resp: falcon.response.Response, source_id: str):
         reqDebugLog(req)
         try:
-            data_item = models.DataItem(json.loads(self.__db_handler.get(b"data-", source_id.encode())))
-            self.__db_handler.delete(b"data-", source_id.encode())
+            data_item = models.DataItem(handlers.load_data_item(self.__db_handler, source_id, ["files"]))
+            with self.__db_handler.batch() as batch:
+                handlers.delete_data_item(batch, source_id)
             if data_item.files:
                 for file in data_item.files:
                     try:
@@ -108,20 +267,145 @@ class DataResource:
 
 
 class CSV:
-    def __init__(self, db_handler: handlers.DB, data_handler: handlers.Data):
-        self.__db_handler = db_handler
+    def __init__(self, data_cache: handlers.DataCache, data_handler: handlers.Data, max_age: int):
+        self.__data_cache = data_cache
         self.__data_handler = data_handler
+        self.__cache_control = "public, max-age={}, immutable".format(max_age)
 
     def on_get(self, req: falcon.request.Request, resp: falcon.response.Response, source_id: str, file: str):
         reqDebugLog(req)
+        size = 0
         try:
-            data_item = models.DataItem(json.loads(self.__db_handler.get(b"data-", source_id.encode())))
-            if file in data_item.files:
-                resp.stream, resp.content_length = self.__data_handler.open(file)
-                resp.content_type = "application/octet-stream"
-                resp.status = falcon.HTTP_200
+            item = self.__data_cache.get(source_id)
+            data_item = item.data_item
+            if file in item.files:
+                try:
+                    etag = data_item.file_info[file]["checksum"]
+                except (TypeError, KeyError):
+                    etag = file
+                last_modified = parseTimestamp(data_item.created)
+                setCacheHeaders(resp, etag, last_modified, self.__cache_control)
+                if isNotModified(req, etag, last_modified):
+                    resp.status = falcon.HTTP_304
+                    return
+                size = self.__data_handler.get_size(file)
+                resp.accept_ranges = "bytes"
+                resp.content_type = content_types.get(data_item.format, "application/octet-stream")
+                _range = getRange(req, size, etag)
+                if _range:
+                    resp.stream = self.__data_handler.open_segments([(file, 0, size)], start=_range[0], length=_range[1] - _range[0] + 1)
+                    resp.content_length = _range[1] - _range[0] + 1
+                    resp.content_range = (_range[0], _range[1], size)
+                    resp.status = falcon.HTTP_206
+                else:
+                    resp.stream, resp.content_length = self.__data_handler.open(file)
+                    resp.status = falcon.HTTP_200
             else:
                 resp.status = falcon.HTTP_404
+        except RangeNotSatisfiable as ex:
+            setRangeNotSatisfiable(resp, size)
+            reqErrorLog(req, ex)
+        except (KeyError, FileNotFoundError) as ex:
+            resp.status = falcon.HTTP_404
+            reqErrorLog(req, ex)
+        except Exception as ex:
+            resp.status = falcon.HTTP_500
+            reqErrorLog(req, ex)
+
+
+class CSVStream:
+    def __init__(self, data_cache: handlers.DataCache, data_handler: handlers.Data):
+        self.__data_cache = data_cache
+        self.__data_handler = data_handler
+
+    @staticmethod
+    def __get_segments(data_item: models.DataItem) -> list:
+        if data_item.format in content_types:
+            raise RuntimeError("format '{}' of '{}' can't be concatenated".format(data_item.format, data_item.source_id))
+        if not handlers.is_indexed(data_item):
+            raise RuntimeError("data of '{}' predates concatenated streaming and must be recreated".format(data_item.source_id))
+        segments = list()
+        for file in data_item.files:
+            offset = data_item.file_info[file]["header"] if segments else 0
+            segments.append((file, offset, data_item.file_info[file]["size"] - offset))
+        return segments
+
+    def on_get(self, req: falcon.request.Request, resp: falcon.response.Response, source_id: str):
+        reqDebugLog(req)
+        size = 0
+        try:
+            data_item = self.__data_cache.get(source_id).data_item
+            if not data_item.files:
+                raise KeyError(source_id)
+            last_modified = parseTimestamp(data_item.created)
+            setCacheHeaders(resp, data_item.checksum, last_modified, "no-cache")
+            if isNotModified(req, data_item.checksum, last_modified):
+                resp.status = falcon.HTTP_304
+                return
+            try:
+                segments = self.__get_segments(data_item)
+            except RuntimeError as ex:
+                resp.status = falcon.HTTP_409
+                reqErrorLog(req, ex)
+                return
+            size = sum(segment[2] for segment in segments)
+            resp.accept_ranges = "bytes"
+            resp.content_type = "application/octet-stream"
+            _range = getRange(req, size, data_item.checksum)
+            if _range:
+                resp.stream = self.__data_handler.open_segments(segments, start=_range[0], length=_range[1] - _range[0] + 1)
+                resp.content_length = _range[1] - _range[0] + 1
+                resp.content_range = (_range[0], _range[1], size)
+                resp.status = falcon.HTTP_206
+            else:
+                resp.stream = self.__data_handler.open_segments(segments)
+                resp.content_length = size
+                resp.status = falcon.HTTP_200
+        except RangeNotSatisfiable as ex:
+            setRangeNotSatisfiable(resp, size)
+            reqErrorLog(req, ex)
+        except (KeyError, FileNotFoundError) as ex:
+            resp.status = falcon.HTTP_404
+            reqErrorLog(req, ex)
+        except Exception as ex:
+            resp.status = falcon.HTTP_500
+            reqErrorLog(req, ex)
+
+
+class Query:
+    def __init__(self, data_cache: handlers.DataCache, data_handler: handlers.Data):
+        self.__data_cache = data_cache
+        self.__data_handler = data_handler
+
+    def on_get(self, req: falcon.request.Request, resp: falcon.response.Response, source_id: str):
+        reqDebugLog(req)
+        try:
+            data_item = self.__data_cache.get(source_id).data_item
+            if not data_item.files:
+                raise KeyError(source_id)
+            etag = hashlib.sha1("{}{}".format(data_item.checksum, req.query_string).encode()).hexdigest()
+            last_modified = parseTimestamp(data_item.created)
+            setCacheHeaders(resp, etag, last_modified, "no-cache")
+            if isNotModified(req, etag, last_modified):
+                resp.status = falcon.HTTP_304
+                return
+            try:
+                resp.stream = self.__data_handler.query(
+                    data_item=data_item,
+                    start=req.get_param("start"),
+                    end=req.get_param("end"),
+                    columns=[column for param in req.get_param_as_list("columns") or list() for column in param.split(",") if column]
+                )
+            except RuntimeError as ex:
+                resp.status = falcon.HTTP_409
+                reqErrorLog(req, ex)
+                return
+            except ValueError as ex:
+                resp.status = falcon.HTTP_400
+                reqErrorLog(req, ex)
+                return
+            resp.content_type = "text/csv"
+            resp.status = falcon.HTTP_200
         except (KeyError, FileNotFoundError) as ex:
             resp.status = falcon.HTTP_404
             reqErrorLog(req, ex)
@@ -139,9 +423,19 @@ class Jobs:
         reqDebugLog(req)
         try:
             req_body = json.load(req.bounded_stream)
-            resp.body = self.__jobs_handler.create(req_body["source_id"])
+            priority = req_body.get("priority", 0)
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                raise ValueError("invalid priority '{}'".format(priority))
+            resp.text = self.__jobs_handler.create(
+                req_body["source_id"],
+                bool(req_body.get("incremental", False)),
+                priority
+            )
             resp.content_type = falcon.MEDIA_TEXT
             resp.status = falcon.HTTP_200
+        except ValueError as ex:
+            resp.status = falcon.HTTP_400
+            reqErrorLog(req, ex)
         except Exception as ex:
             resp.status = falcon.HTTP_500
             reqErrorLog(req, ex)
@@ -150,13 +444,16 @@ class Jobs:
         reqDebugLog(req)
         try:
             resp.content_type = falcon.MEDIA_JSON
-            resp.body = json.dumps(
+            resp.text = json.dumps(
                 dict(
                     current=self.__jobs_handler.list_jobs(),
-                    history=self.__db_handler.list_keys(b"jobs-")
+                    history=listKeys(req, resp, self.__db_handler, b"jobs-")
                 )
             )
             resp.status = falcon.HTTP_200
+        except ValueError as ex:
+            resp.status = falcon.HTTP_400
+            reqErrorLog(req, ex)
         except Exception as ex:
             resp.status = falcon.HTTP_500
             reqErrorLog(req, ex)
@@ -172,9 +469,9 @@ class Job:
         try:
             resp.content_type = falcon.MEDIA_JSON
             try:
-                resp.body = json.dumps(dict(self.__jobs_handler.get_job(job_id)))
+                resp.text = json.dumps(dict(self.__jobs_handler.get_job(job_id)))
             except KeyError:
-                resp.body = self.__db_handler.get(b"jobs-", job_id.encode())
+                resp.data = self.__db_handler.get(b"jobs-", job_id.encode())
             resp.status = falcon.HTTP_200
         except KeyError as ex:
             resp.status = falcon.HTTP_404
@@ -182,3 +479,37 @@ class Job:
         except Exception as ex:
             resp.status = falcon.HTTP_500
             reqErrorLog(req, ex)
+
+
+class Metrics:
+    def on_get(self, req: falcon.request.Request, resp: falcon.response.Response):
+        try:
+            resp.content_type = metrics.content_type
+            resp.data = metrics.generate()
+            resp.status = falcon.HTTP_200
+        except Exception as ex:
+            resp.status = falcon.HTTP_500
+            reqErrorLog(req, ex)
+
+
+class MetricsMiddleware:
+    def process_request(self, req: falcon.request.Request, resp: falcon.response.Response):
+        req.context.start = time.perf_counter()
+
+    def process_response(self, req: falcon.request.Request, resp: falcon.response.Response, resource, req_succeeded: bool):
+        route = req.uri_template or "unmatched"
+        metrics.observe(
+            "http_request_seconds",
+            time.perf_counter() - req.context.start,
+            route=route,
+            method=req.method,
+            status=resp.status.split(" ", 1)[0]
+        )
+        if resp.stream is not None and resp.get_header("Content-Length"):
+            metrics.observe("http_response_bytes", int(resp.get_header("Content-Length")), route=route)
+
+    async def process_request_async(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
@@ -0,0 +1,78 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("Resource",)
+
+
+import falcon
+import falcon.asgi
+import concurrent.futures
+import functools
+import asyncio
+import typing
+import io
+
+
+class BufferedRequest:
+    def __init__(self, req: falcon.asgi.Request, body: bytes):
+        self.__req = req
+        self.stream = self.bounded_stream = io.BytesIO(body)
+
+    def __getattr__(self, attr):
+        return getattr(self.__req, attr)
+
+
+async def iterStream(stream, executor: concurrent.futures.Executor, chunk_size: int) -> typing.AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    try:
+        if hasattr(stream, "read"):
+            while True:
+                chunk = await loop.run_in_executor(executor, stream.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            iterator = iter(stream)
+            while True:
+                chunk = await loop.run_in_executor(executor, next, iterator, None)
+                if chunk is None:
+                    break
+                yield chunk
+    finally:
+        if hasattr(stream, "close"):
+            await loop.run_in_executor(executor, stream.close)
+
+
+class Resource:
+    def __init__(self, resource, executor: concurrent.futures.Executor, chunk_size: int):
+        self.__executor = executor
+        self.__chunk_size = chunk_size
+        for method in falcon.COMBINED_METHODS:
+            responder = getattr(resource, "on_{}".format(method.lower()), None)
+            if responder:
+                setattr(self, "on_{}".format(method.lower()), self.__wrap(responder))
+
+    def __wrap(self, responder: typing.Callable):
+        async def on_request(req: falcon.asgi.Request, resp: falcon.asgi.Response, **kwargs):
+            body = await req.bounded_stream.read() if req.content_length else bytes()
+            await asyncio.get_running_loop().run_in_executor(
+                self.__executor,
+                functools.partial(responder, BufferedRequest(req, body), resp, **kwargs)
+            )
+            if resp.stream is not None:
+                resp.stream = iterStream(resp.stream, self.__executor, self.__chunk_size)
+
+        return on_request
@@ -41,13 +41,47 @@ class Conf:
         db_api_time_format = "2006-01-02T15:04:05.000000Z07:00"
         start_year = 1970
         chunk_size = 50000
+        chunk_size_min = 1000
+        chunk_size_max = 500000
+        page_seconds = 0.0
+        page_bytes = 0
+        file_rows = 0
+        file_size = 0
+        file_period = None
         compression = True
+        codec = "gzip"
+        compression_level = -1
+        compression_threads = 0
         single_header = False
+        fetch_workers = 4
+        fetch_buffer = 2
+        fetch_batch = 1000
+        render_workers = 1
+        float_precision = -1
+        index_interval = 1000
+        retries = 5
+        backoff = 0.5
+        backoff_max = 30.0
+        connect_timeout = 10.0
+        read_timeout = 300.0
+        upstream_concurrency = 8
+        upstream_rate = 0.0
+        upstream_latency = 0.0
+
+    @simple_env_var.section
+    class Api:
+        max_age = 604800
+        data_cache_size = 1000
+        io_threads = 16
+        stream_chunk_size = 65536
 
     @simple_env_var.section
     class Jobs:
         max_num = 5
         check = 5
+        worker_max_jobs = 100
+        worker_max_rss = 0
+        progress_interval = 1.0
 
     @simple_env_var.section
     class Auth:
@@ -55,6 +89,7 @@ class Conf:
         client_id = None
         client_secret = None
         user_id = None
+        token_ttl = 60
 
 
 conf = Conf(load=False)
@@ -15,5 +15,8 @@
 """
 
 from .db import *
+from .items import *
+from .cache import *
+from .upstream import *
 from .data import *
 from .jobs import *
@@ -0,0 +1,77 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("DataCache", "CacheItem")
+
+
+from .. import models, metrics
+from .db import DB
+from .items import load_data_item
+import collections
+import threading
+import hashlib
+import typing
+import json
+
+
+class CacheItem:
+    __slots__ = ("body", "etag", "data_item", "files")
+
+    def __init__(self, record: dict):
+        self.body = json.dumps(record).encode()
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.data_item = models.DataItem(record)
+        self.files = frozenset(self.data_item.files or ())
+
+
+class DataCache:
+    def __init__(self, db_handler: DB, size: int):
+        self.__db_handler = db_handler
+        self.__size = size
+        self.__items: "collections.OrderedDict[bytes, CacheItem]" = collections.OrderedDict()
+        self.__generation = 0
+        self.__lock = threading.Lock()
+        db_handler.add_listener(b"data-", self.invalidate)
+
+    def get(self, source_id: str) -> CacheItem:
+        key = source_id.encode()
+        with self.__lock:
+            try:
+                self.__items.move_to_end(key)
+                item = self.__items[key]
+            except KeyError:
+                generation = self.__generation
+                item = None
+        if item:
+            metrics.observe("data_cache_requests", outcome="hit")
+            return item
+        metrics.observe("data_cache_requests", outcome="miss")
+        item = CacheItem(load_data_item(self.__db_handler, source_id))
+        with self.__lock:
+            if self.__size > 0 and generation == self.__generation:
+                self.__items[key] = item
+                while len(self.__items) > self.__size:
+                    self.__items.popitem(last=False)
+        return item
+
+    def peek(self, source_id: str) -> typing.Optional[CacheItem]:
+        with self.__lock:
+            return self.__items.get(source_id.encode())
+
+    def invalidate(self, key: bytes):
+        with self.__lock:
+            self.__generation += 1
+            self.__items.pop(key, None)
@@ -14,19 +14,33 @@
    limitations under the License.
 """
 
-__all__ = ("Data",)
+__all__ = ("Data", "is_indexed")
 
 
 from ..logger import getLogger
 from .. import models, util
-import requests
+from .. import handlers
+import array
 import json
 import datetime
 import uuid
 import os
-import auth_client
 import hashlib
+import copy
+import functools
+import typing
+import queue
+import threading
+import contextlib
 import time
+import concurrent.futures
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 logger = getLogger(__name__.split(".", 1)[-1])
@@ -44,9 +58,296 @@ def gen_year_map(start: int, end: int, base: int):
     return map
 
 
+max_stall = 5.0
+
+table_batch_rows = 65536
+
+
+def is_indexed(data_item: models.DataItem) -> bool:
+    for file in data_item.files or list():
+        file_info = (data_item.file_info or dict()).get(file)
+        if not file_info or "header" not in file_info or "size" not in file_info:
+            return False
+    return True
+
+
+type_names = {
+    bool: models.ColumnType.boolean,
+    int: models.ColumnType.integer,
+    float: models.ColumnType.float,
+    type(None): None
+}
+
+
+def resolve_type(names: typing.Iterable) -> str:
+    names = set(names)
+    names.discard(None)
+    if not names or models.ColumnType.string in names:
+        return models.ColumnType.string
+    if names == {models.ColumnType.boolean}:
+        return models.ColumnType.boolean
+    if models.ColumnType.float in names:
+        return models.ColumnType.float
+    return models.ColumnType.integer
+
+
+def gen_formatters(float_precision: int) -> dict:
+    def format_float(value: float) -> str:
+        value = repr(value) if float_precision < 0 else "{:.{}f}".format(value, float_precision)
+        if "." in value and "e" not in value:
+            value = value.rstrip("0").rstrip(".")
+        return "0" if value == "-0" else value
+
+    return {
+        bool: lambda value: "1" if value else "0",
+        float: format_float,
+        type(None): lambda value: str()
+    }
+
+
+class LayoutPositions:
+    def __init__(self, columns: list, size: int = 4096):
+        self.__col_index = {columns[x]: x for x in range(len(columns))}
+        self.__size = size
+        self.__column_positions = list()
+        self.__cache = dict()
+
+    def get(self, columns: list, layouts: list) -> list:
+        for column in columns[len(self.__column_positions):]:
+            self.__column_positions.append(self.__col_index[column])
+        column_positions = self.__column_positions
+        cache = self.__cache
+        positions = list()
+        for layout in layouts:
+            try:
+                positions.append(cache[layout])
+            except KeyError:
+                if len(cache) >= self.__size:
+                    cache.clear()
+                cache[layout] = [column_positions[column] for column in array.array("I", layout)]
+                positions.append(cache[layout])
+        return positions
+
+
+class RowRenderer:
+    def __init__(self, columns: list, default_values: dict, delimiter: str, float_precision: int, empty_defaults: bool):
+        self.__formatters = gen_formatters(float_precision)
+        self.__layouts = LayoutPositions(columns)
+        if empty_defaults:
+            self.__template = [str() for _ in columns]
+        else:
+            self.__template = [self.__format(default_values[column]) if column in default_values else str() for column in columns]
+        self.__delimiter = delimiter
+        self.__positions = list()
+
+    def __format(self, value) -> str:
+        return self.__formatters.get(type(value), str)(value)
+
+    def set_layouts(self, columns: list, layouts: list):
+        self.__positions = self.__layouts.get(columns, layouts)
+
+    def render(self, rows: typing.Sequence[typing.Tuple[int, str, tuple]]) -> bytes:
+        template = self.__template
+        positions = self.__positions
+        get_formatter = self.__formatters.get
+        join = self.__delimiter.join
+        lines = list()
+        for layout, timestamp, values in rows:
+            line = template.copy()
+            line[0] = timestamp
+            for pos, value in zip(positions[layout], values):
+                line[pos] = get_formatter(type(value), str)(value)
+            lines.append(join(line))
+        lines.append(str())
+        return "\n".join(lines).encode()
+
+
+def render_chunk(chunk_path: str, file_path: str, header: typing.Optional[bytes], columns: list, default_values: dict, delimiter: str, codec: typing.Optional[str], compression_level: int, compression_threads: int, float_precision: int, empty_defaults: bool, index_interval: int) -> dict:
+    renderer = RowRenderer(columns=columns, default_values=default_values, delimiter=delimiter, float_precision=float_precision, empty_defaults=empty_defaults)
+    header_size = 0
+    index = list()
+    count = 0
+    timestamp = None
+    with open(file_path, "wb") as file:
+        file = hash_obj = util.Hash(file)
+        if codec:
+            file = util.Compress(file, codec=codec, level=compression_level, threads=compression_threads)
+        if header:
+            file.write(header)
+            if codec:
+                file.end_member()
+            header_size = file.tell()
+        with open(chunk_path, "rb") as chunk_file:
+            for spill_columns, layouts, rows in util.read_spill(chunk_file):
+                renderer.set_layouts(spill_columns, layouts)
+                start = 0
+                while start < len(rows):
+                    if count == 0 or (index_interval > 0 and count % index_interval == 0):
+                        if codec and count:
+                            file.end_member()
+                        index.append([rows[start][1], file.tell()])
+                    end = len(rows) if index_interval <= 0 else min(len(rows), start + index_interval - count % index_interval)
+                    file.write(renderer.render(rows[start:end]))
+                    count += end - start
+                    start = end
+                if rows:
+                    timestamp = rows[-1][1]
+        file.flush()
+        return dict(
+            size=file.tell(),
+            header=header_size,
+            checksum=hash_obj.hexdigest(),
+            rows=count,
+            first=index[0][0] if index else None,
+            last=timestamp,
+            index=index
+        )
+
+
+def render_table_chunk(chunk_path: str, file_path: str, header: typing.Optional[bytes], columns: list, column_types: dict, default_values: dict, time_format: str, file_format: str, codec: typing.Optional[str], compression_level: int) -> dict:
+    if pyarrow is None:
+        raise RuntimeError("format '{}' requires pyarrow".format(file_format))
+    layout_positions = LayoutPositions(columns)
+    template = [default_values.get(column) for column in columns]
+
+    def parse_time(value: str) -> datetime.datetime:
+        timestamp = datetime.datetime.strptime(value, time_format)
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=datetime.timezone.utc)
+        return timestamp
+
+    arrow_types = {
+        models.ColumnType.timestamp: (pyarrow.timestamp("us", tz="UTC"), parse_time),
+        models.ColumnType.boolean: (pyarrow.bool_(), bool),
+        models.ColumnType.integer: (pyarrow.int64(), int),
+        models.ColumnType.float: (pyarrow.float64(), float)
+    }
+    types = [arrow_types.get(column_types.get(column), (pyarrow.string(), str)) for column in columns]
+    schema = pyarrow.schema([(column, arrow_type) for column, (arrow_type, _) in zip(columns, types)])
+
+    def to_table(lines: list):
+        arrays = list()
+        for (arrow_type, cast), values in zip(types, zip(*lines) if lines else ([] for _ in columns)):
+            if cast is parse_time:
+                arrays.append(pyarrow.array([None if value is None else parse_time(value) for value in values], type=arrow_type))
+                continue
+            try:
+                arrays.append(pyarrow.array(values, type=arrow_type))
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                arrays.append(pyarrow.array([None if value is None else cast(value) for value in values], type=arrow_type))
+        return pyarrow.table(arrays, schema=schema)
+
+    with open(file_path, "wb") as file:
+        file = util.Hash(file)
+        if file_format == models.FileFormat.parquet:
+            writer = pyarrow.parquet.ParquetWriter(
+                file,
+                schema,
+                compression=codec or "none",
+                compression_level=compression_level if codec and compression_level >= 0 else None
+            )
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=pyarrow.Codec(codec, compression_level if compression_level >= 0 else None) if codec else None)
+            writer = pyarrow.ipc.new_file(file, schema, options=options)
+        with writer, open(chunk_path, "rb") as chunk_file:
+            lines = list()
+            written = False
+            first = None
+            timestamp = None
+            for spill_columns, layouts, rows in util.read_spill(chunk_file):
+                positions = layout_positions.get(spill_columns, layouts)
+                for layout, timestamp, values in rows:
+                    if first is None:
+                        first = timestamp
+                    line = template.copy()
+                    line[0] = timestamp
+                    for pos, value in zip(positions[layout], values):
+                        line[pos] = value
+                    lines.append(line)
+                    if len(lines) >= table_batch_rows:
+                        writer.write_table(to_table(lines))
+                        lines.clear()
+                        written = True
+            if lines or not written:
+                writer.write_table(to_table(lines))
+        return dict(size=file.tell(), header=0, checksum=file.hexdigest(), first=first, last=timestamp)
+
+
+period_lengths = {
+    models.FilePeriod.hour: 13,
+    models.FilePeriod.day: 10,
+    models.FilePeriod.month: 7,
+    models.FilePeriod.year: 4
+}
+
+
+class SpillParts:
+    def __init__(self, tmp_path: str, parts: list, types: typing.Dict[str, set], max_rows: int, max_size: int, period: typing.Optional[str]):
+        self.__tmp_path = tmp_path
+        self.__parts = parts
+        self.__types = types
+        self.__max_rows = max_rows
+        self.__max_size = max_size
+        self.__period_length = period_lengths[period] if period else None
+        self.__file: typing.Optional[typing.BinaryIO] = None
+        self.__spill: typing.Optional[util.SpillWriter] = None
+        self.__rows = 0
+        self.__size = 0
+        self.__period = None
+
+    @property
+    def split(self) -> bool:
+        return self.__max_rows > 0 or self.__max_size > 0 or bool(self.__period_length)
+
+    def __open(self, timestamp: str):
+        part_name = uuid.uuid4().hex
+        self.__parts.append(part_name)
+        self.__file = open(os.path.join(self.__tmp_path, part_name), "wb")
+        self.__spill = util.SpillWriter(self.__file)
+        self.__rows = 0
+        self.__size = 0
+        self.__period = timestamp[:self.__period_length] if self.__period_length else None
+
+    def write(self, timestamp: str, data: dict, size: int):
+        if self.__spill and (
+            (self.__max_rows > 0 and self.__rows >= self.__max_rows) or
+            (self.__max_size > 0 and self.__size >= self.__max_size) or
+            (self.__period_length and timestamp[:self.__period_length] != self.__period)
+        ):
+            self.close()
+        if not self.__spill:
+            self.__open(timestamp)
+        self.__spill.write(timestamp, data)
+        self.__rows += 1
+        self.__size += size
+
+    def close(self):
+        if not self.__spill:
+            return
+        try:
+            self.__spill.flush()
+        finally:
+            self.__file.close()
+        for key, _types in self.__spill.get_types().items():
+            self.__types.setdefault(key, set()).update(type_names.get(_type, models.ColumnType.string) for _type in _types)
+        self.__file = None
+        self.__spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type and self.__file:
+            self.__file.close()
+            self.__file = None
+            self.__spill = None
+        else:
+            self.close()
+
+
 class Data:
-    def __init__(self, auth_handler: auth_client.Client, data_path: str, tmp_path: str, db_api_url: str, export_api_url: str, time_format: str, db_api_time_format: str, start_year: int, chunk_size: int, usr_id: str, compression: bool, single_header: bool):
-        self.__auth_handler = auth_handler
+    def __init__(self, upstream_handler: handlers.Upstream, data_path: str, tmp_path: str, db_api_url: str, export_api_url: str, time_format: str, db_api_time_format: str, start_year: int, chunk_size: int, chunk_size_min: int, chunk_size_max: int, page_seconds: float, page_bytes: int, file_rows: int, file_size: int, file_period: typing.Optional[str], compression: bool, codec: str, compression_level: int, compression_threads: int, single_header: bool, fetch_workers: int, fetch_buffer: int, fetch_batch: int, render_workers: int, float_precision: int, index_interval: int):
+        self.__upstream_handler = upstream_handler
         self.__data_path = data_path
         self.__tmp_path = tmp_path
         self.__db_api_url = db_api_url
@@ -55,32 +356,43 @@ class Data:
         self.__db_api_time_format = db_api_time_format
         self.__start_year = start_year
         self.__chunk_size = chunk_size
-        self.__usr_id = usr_id
+        self.__chunk_size_min = chunk_size_min
+        self.__chunk_size_max = chunk_size_max
+        self.__page_seconds = page_seconds
+        self.__page_bytes = page_bytes
+        self.__file_rows = file_rows
+        self.__file_size = file_size
+        self.__file_period = file_period
         self.__compression = compression
+        self.__codec = codec
+        self.__compression_level = compression_level
+        self.__compression_threads = compression_threads
         self.__single_header = single_header
+        self.__fetch_workers = max(fetch_workers, 1)
+        self.__fetch_buffer = max(fetch_buffer, 1)
+        self.__fetch_batch = max(fetch_batch, 1)
+        self.__render_workers = render_workers
+        self.__float_precision = float_precision
+        self.__index_interval = index_interval
 
-    def __execute_query(self, measurement: str, sort: str, **kwargs):
+    def __request_query(self, measurement: str, sort: str, stream: bool = False, **kwargs):
         kwargs["measurement"] = measurement
         kwargs["columns"] = [{"name": "data"}, {"name": "default_values"}]
-        retries = 0
-        while True:
-            try:
-                resp = requests.post(
-                    url="{}?format=table&order_direction={}&order_column_index=0&time_format={}".format(
-                        self.__db_api_url,
-                        sort,
-                        self.__db_api_time_format
-                    ),
-                    headers={"X-UserId": self.__usr_id, "Authorization": "Bearer " + self.__auth_handler.get_access_token()},
-                    json=[kwargs]
-                )
-                if not resp.ok:
-                    raise RuntimeError(resp.status_code)
-                return resp.json()
-            except Exception as ex:
-                if retries >= 5:
-                    raise ex
-                retries += 1
+        return self.__upstream_handler.request(
+            name="db_api",
+            method="POST",
+            url="{}?format=table&order_direction={}&order_column_index=0&time_format={}".format(
+                self.__db_api_url,
+                sort,
+                self.__db_api_time_format
+            ),
+            json=[kwargs],
+            stream=stream,
+            limited=True
+        )
+
+    def __execute_query(self, measurement: str, sort: str, **kwargs):
+        return self.__request_query(measurement=measurement, sort=sort, **kwargs).json()
 
     def __get_start_timestamp(self, measurement: str) -> str:
         return self.__execute_query(measurement=measurement, sort="asc", limit=1)[0][0]
@@ -88,30 +400,93 @@ class Data:
     def __get_end_timestamp(self, measurement: str) -> str:
         return self.__execute_query(measurement=measurement, sort="desc", limit=1)[0][0]
 
-    def __get_chunks(self, measurement: str, start: str, end: str):
-        start = datetime.datetime.strptime(start, self.__time_format) - datetime.timedelta(microseconds=1)
+    def __get_chunks(self, measurement: str, start: str, end: str, inclusive: bool = True):
+        start = datetime.datetime.strptime(start, self.__time_format)
+        if inclusive:
+            start = start - datetime.timedelta(microseconds=1)
         start = start.isoformat() + "Z"
         end = datetime.datetime.strptime(end, self.__time_format) + datetime.timedelta(microseconds=1)
         end = end.isoformat() + "Z"
+        page_size = util.PageSize(
+            initial=self.__chunk_size,
+            minimum=self.__chunk_size_min,
+            maximum=self.__chunk_size_max,
+            target_seconds=self.__page_seconds,
+            max_bytes=self.__page_bytes
+        )
+        failures = 0
+        page_rows = 0
+        seconds = 0.0
+        size = 0
         while True:
-            chunk = self.__execute_query(measurement=measurement, sort="asc", limit=self.__chunk_size, time={"start": start, "end": end})
-            if not chunk:
+            resumed = time.perf_counter()
+            try:
+                resp = self.__request_query(measurement=measurement, sort="asc", limit=max(page_size.size - page_rows, 1), time={"start": start, "end": end}, stream=True)
+            except Exception as ex:
+                if not page_size.shrink():
+                    raise ex
+                logger.warning("query for '{}' failed - retrying with page size of '{}': {}".format(measurement, page_size.size, ex))
+                continue
+            rows = 0
+            batch = list()
+            complete = False
+
+            def read():
+                nonlocal size
+                for data in resp.iter_content(chunk_size=65536):
+                    size += len(data)
+                    yield data
+
+            try:
+                for row in util.iter_json_array(read()):
+                    batch.append(row)
+                    rows += 1
+                    if len(batch) >= self.__fetch_batch:
+                        start = batch[-1][0]
+                        suspended = time.perf_counter()
+                        seconds += suspended - resumed
+                        yield batch, False
+                        batch = list()
+                        resumed = time.perf_counter()
+                        if resumed - suspended > max_stall:
+                            logger.debug("reading response for '{}' stalled for '{:.2f}s' - resuming".format(measurement, resumed - suspended))
+                            break
+                else:
+                    complete = True
+            except Exception as ex:
+                if not rows:
+                    failures += 1
+                    if failures > self.__upstream_handler.retries and not page_size.shrink():
+                        raise ex
+                    delay = self.__upstream_handler.get_delay(failures)
+                    logger.warning("reading response for '{}' failed - retrying in {:.2f}s ({}): {}".format(measurement, delay, failures, ex))
+                    time.sleep(delay)
+                    continue
+                logger.warning("response for '{}' broke off after '{}' rows - resuming: {}".format(measurement, rows, ex))
+            finally:
+                resp.close()
+            failures = 0
+            seconds += time.perf_counter() - resumed
+            page_rows += rows
+            if batch:
+                start = batch[-1][0]
+            if not complete and page_rows < page_size.size:
+                if batch:
+                    yield batch, False
+                continue
+            if not page_rows:
                 break
-            else:
-                logger.debug(
-                    "retrieved chunk with size of '{}' from '{}' to '{}' for '{}'".format(len(chunk), start, end, measurement)
-                )
-                start = chunk[-1][0]
-                yield chunk
+            page_size.update(rows=page_rows, seconds=seconds, bytes=size)
+            logger.debug(
+                "retrieved chunk with size of '{}' from '{}' to '{}' for '{}'".format(page_rows, start, end, measurement)
+            )
+            page_rows = 0
+            seconds = 0.0
+            size = 0
+            yield batch, True
 
     def __get_export_ids(self, source_id: str):
-        resp = requests.get(
-            url=self.__export_api_url,
-            headers={"X-UserId": self.__usr_id, "Authorization": "Bearer " + self.__auth_handler.get_access_token()}
-        )
-        if not resp.ok:
-            raise RuntimeError(resp.status_code)
-        resp = resp.json()
+        resp = self.__upstream_handler.request(name="export_api", method="GET", url=self.__export_api_url).json()
         src_ids = set()
         for item in resp["instances"]:
             if item["Description"] == source_id:
@@ -119,96 +494,347 @@ class Data:
                 src_ids.add(item["Measurement"])
         return src_ids
 
-    def create(self, source_id: str, time_field: str, delimiter: str) -> models.DataItem:
+    def __get_timestamps(self, src_ids: typing.Iterable, start: bool = True) -> typing.Dict[str, tuple]:
+        src_ids = list(src_ids)
+
+        def probe(src_id: str) -> tuple:
+            return self.__get_start_timestamp(measurement=src_id) if start else None, self.__get_end_timestamp(measurement=src_id)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.__fetch_workers, thread_name_prefix="probe") as executor:
+            return dict(zip(src_ids, executor.map(probe, src_ids)))
+
+    def __produce(self, src_id: str, start: str, end: str, inclusive: bool, buffer: queue.Queue, stop: threading.Event):
+        try:
+            for batch in self.__get_chunks(measurement=src_id, start=start, end=end, inclusive=inclusive):
+                while not stop.is_set():
+                    try:
+                        buffer.put(batch, timeout=1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            item = None
+        except Exception as ex:
+            item = ex
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                break
+            except queue.Full:
+                pass
+
+    def __prefetch(self, data_item: models.DataItem, ranges: list):
+        stop = threading.Event()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.__fetch_workers, thread_name_prefix="fetch") as executor:
+            try:
+                buffers = list()
+                for src_id, start, inclusive in ranges:
+                    buffer = queue.Queue(maxsize=self.__fetch_buffer)
+                    executor.submit(self.__produce, src_id, start, data_item.sources[src_id]["end"], inclusive, buffer, stop)
+                    buffers.append((src_id, buffer))
+                for src_id, buffer in buffers:
+                    while True:
+                        chunk = buffer.get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        yield src_id, chunk
+            finally:
+                stop.set()
+
+    def __add_source(self, data_item: models.DataItem, src_id: str, start: str, end: str, start_year: int) -> int:
+        data_item.sources[src_id] = dict()
+        data_item.sources[src_id]["start"] = start
+        data_item.sources[src_id]["end"] = end
+        data_item.sources[src_id]["year_map"] = gen_year_map(
+            start=int(data_item.sources[src_id]["start"].split("-", 1)[0]),
+            end=int(data_item.sources[src_id]["end"].split("-", 1)[0]),
+            base=start_year
+        )
+        return start_year + len(data_item.sources[src_id]["year_map"])
+
+    def __fetch(self, data_item: models.DataItem, ranges: list, chunks: list, types: typing.Dict[str, set], progress: util.Progress):
+        spans = dict()
+        for src_id, start, _ in ranges:
+            start = self.__parse_time(start)
+            spans[src_id] = (start, (self.__parse_time(data_item.sources[src_id]["end"]) - start).total_seconds())
+        total_span = sum(span for _, span in spans.values())
+        done = dict()
+        parts = SpillParts(
+            tmp_path=self.__tmp_path,
+            parts=chunks,
+            types=types,
+            max_rows=self.__file_rows if data_item.file_rows is None else data_item.file_rows,
+            max_size=self.__file_size if data_item.file_size is None else data_item.file_size,
+            period=data_item.file_period or self.__file_period
+        )
+        with parts, contextlib.closing(self.__prefetch(data_item=data_item, ranges=ranges)) as prefetched:
+            previous = None
+            default_values = None
+            for src_id, (batch, page_end) in prefetched:
+                if src_id != previous:
+                    parts.close()
+                previous = src_id
+                source = data_item.sources[src_id]
+                data_item.size = data_item.size + len(batch)
+                for item in batch:
+                    data: dict = json.loads(item[1])
+                    data.pop(data_item.time_field, None)
+                    parts.write(shift_year(item[0], source["year_map"]), data, len(item[1]))
+                    if item[2] != default_values:
+                        default_values = item[2]
+                        data_item.default_values.update(json.loads(default_values))
+                if batch:
+                    done[src_id] = (self.__parse_time(batch[-1][0]) - spans[src_id][0]).total_seconds()
+                    progress.update(rows=len(batch), fraction=min(sum(done.values()) / total_span, 1.0) if total_span > 0 else None)
+                if page_end and not parts.split:
+                    parts.close()
+        logger.debug("upstream stats for '{}': {}".format(data_item.source_id, self.__upstream_handler.get_stats()))
+
+    def __render(self, data_item: models.DataItem, chunks: list, header: bool, progress: util.Progress):
+        base_name = uuid.uuid4().hex
+        header_line = "{}\n".format(data_item.delimiter.join(data_item.columns)).encode()
+        file_names = list()
+        chunk_paths = list()
+        file_paths = list()
+        headers = list()
+        for x in range(len(chunks)):
+            file_names.append("{}_{}".format(base_name, x))
+            data_item.files.append(file_names[x])
+            chunk_paths.append(os.path.join(self.__tmp_path, chunks[x]))
+            file_paths.append(os.path.join(self.__data_path, file_names[x]))
+            headers.append(header_line if header and (x == 0 or not self.__single_header) else None)
+        compression_level = self.__compression_level if data_item.compression_level is None else data_item.compression_level
+        if data_item.format in (models.FileFormat.parquet, models.FileFormat.arrow):
+            render = functools.partial(
+                render_table_chunk,
+                columns=data_item.columns,
+                column_types=data_item.column_types,
+                default_values=data_item.default_values,
+                time_format=self.__time_format,
+                file_format=data_item.format,
+                codec=data_item.codec,
+                compression_level=compression_level
+            )
+        else:
+            render = functools.partial(
+                render_chunk,
+                columns=data_item.columns,
+                default_values=data_item.default_values,
+                delimiter=data_item.delimiter,
+                codec=data_item.codec,
+                compression_level=compression_level,
+                compression_threads=self.__compression_threads,
+                float_precision=self.__float_precision,
+                empty_defaults=data_item.empty_defaults,
+                index_interval=self.__index_interval
+            )
+        if self.__render_workers > 1 and len(chunks) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.__render_workers, len(chunks))) as executor:
+                for x, file_info in enumerate(executor.map(render, chunk_paths, file_paths, headers)):
+                    data_item.file_info[file_names[x]] = file_info
+                    progress.update(bytes=file_info["size"], fraction=(x + 1) / len(chunks))
+                    logger.debug("rendered chunk {}/{}".format(x + 1, len(chunks)))
+        else:
+            for x in range(len(chunks)):
+                data_item.file_info[file_names[x]] = render(chunk_paths[x], file_paths[x], headers[x])
+                progress.update(bytes=data_item.file_info[file_names[x]]["size"], fraction=(x + 1) / len(chunks))
+                logger.debug("rendered chunk {}/{}".format(x + 1, len(chunks)))
+
+    @staticmethod
+    def __set_columns(data_item: models.DataItem, types: typing.Dict[str, set]):
+        types.pop(data_item.time_field, None)
+        for key, value in data_item.default_values.items():
+            if key in types:
+                types[key].add(type_names.get(type(value), models.ColumnType.string))
+        data_item.columns = [data_item.time_field, *sorted(types)]
+        data_item.column_types = {data_item.time_field: models.ColumnType.timestamp}
+        for column in data_item.columns[1:]:
+            data_item.column_types[column] = resolve_type(types[column])
+
+    def __checksum(self, data_item: models.DataItem):
+        checksum = hashlib.sha256()
+        for _file in data_item.files:
+            file_info = data_item.file_info.get(_file)
+            file_checksum = file_info.get("checksum") if file_info else None
+            if not file_checksum:
+                file_checksum = hashlib.sha256()
+                with open(os.path.join(self.__data_path, _file), "rb") as file:
+                    buffer = file.read(65536)
+                    while buffer:
+                        file_checksum.update(buffer)
+                        buffer = file.read(65536)
+                file_checksum = file_checksum.hexdigest()
+                if file_info:
+                    file_info["checksum"] = file_checksum
+            checksum.update(file_checksum.encode())
+        data_item.checksum = checksum.hexdigest()
+
+    def __get_codec(self, data_item: models.DataItem) -> typing.Optional[str]:
+        if not self.__compression:
+            return None
+        codec = data_item.codec or self.__codec
+        if data_item.format == models.FileFormat.arrow and codec == models.Codec.gzip:
+            return models.Codec.zstd
+        return codec
+
+    def create(self, request: models.DataItem, progress: typing.Optional[util.Progress] = None) -> models.DataItem:
+        progress = progress or util.Progress()
         data_item = models.DataItem()
-        data_item.source_id = source_id
-        data_item.time_field = time_field
-        data_item.delimiter = delimiter
+        data_item.source_id = request.source_id
+        data_item.time_field = request.time_field
+        data_item.delimiter = request.delimiter
+        data_item.format = request.format
+        data_item.empty_defaults = request.empty_defaults
+        data_item.codec = self.__get_codec(request)
+        data_item.compression_level = request.compression_level
+        data_item.file_rows = request.file_rows
+        data_item.file_size = request.file_size
+        data_item.file_period = request.file_period
         data_item.sources = dict()
         data_item.default_values = dict()
         data_item.files = list()
+        data_item.file_info = dict()
         data_item.compressed = self.__compression
         start_year = self.__start_year
-        base_name = uuid.uuid4().hex
         chunks = list()
-        columns = set()
+        types = dict()
         try:
-            for src_id in sorted(self.__get_export_ids(data_item.source_id)):
-                data_item.sources[src_id] = dict()
-                data_item.sources[src_id]["start"] = self.__get_start_timestamp(measurement=src_id)
-                data_item.sources[src_id]["end"] = self.__get_end_timestamp(measurement=src_id)
-                data_item.sources[src_id]["year_map"] = gen_year_map(
-                    start=int(data_item.sources[src_id]["start"].split("-", 1)[0]),
-                    end=int(data_item.sources[src_id]["end"].split("-", 1)[0]),
-                    base=start_year
+            progress.phase(models.JobPhase.export_lookup)
+            src_ids = self.__get_export_ids(data_item.source_id)
+            progress.phase(models.JobPhase.probe)
+            timestamps = self.__get_timestamps(src_ids)
+            for src_id in sorted(timestamps):
+                start_year = self.__add_source(
+                    data_item=data_item,
+                    src_id=src_id,
+                    start=timestamps[src_id][0],
+                    end=timestamps[src_id][1],
+                    start_year=start_year
                 )
-                start_year = start_year + len(data_item.sources[src_id]["year_map"])
-            for src_id, source in data_item.sources.items():
-                for chunk in self.__get_chunks(measurement=src_id, start=source["start"], end=source["end"]):
-                    chunk_name = uuid.uuid4().hex
-                    chunks.append(chunk_name)
-                    data_item.size = data_item.size + len(chunk)
-                    with open(os.path.join(self.__tmp_path, chunk_name), "wb") as file:
-                        for item in chunk:
-                            data: dict = json.loads(item[1])
-                            data[data_item.time_field] = shift_year(item[0], source["year_map"])
-                            columns.update(data.keys())
-                            data_item.default_values.update(json.loads(item[2]))
-                            file.write("{}\n".format(json.dumps(data, separators=(',', ':'))).encode())
-            columns.discard(data_item.time_field)
-            data_item.columns = [data_item.time_field, *sorted(columns)]
-            line_map = dict()
-            for x in range(len(data_item.columns)):
-                line_map[x] = data_item.columns[x]
-            _range = range(len(data_item.columns))
-            _line = list()
-            chunk_count = 0
-            for chunk in chunks:
-                chunk_count += 1
-                logger.debug("reading chunk {}/{} ...".format(chunk_count, len(chunks)))
-                file_name = "{}_{}".format(base_name, time.time()).replace(".", "")
-                with open(os.path.join(self.__data_path, file_name), "wb") as file:
-                    data_item.files.append(file_name)
-                    if self.__compression:
-                        file = util.Compress(file)
-                    if chunk_count == 1 or not self.__single_header:
-                        header = "{}\n".format(data_item.delimiter.join(data_item.columns)).encode()
-                        file.write(header)
-                    with open(os.path.join(self.__tmp_path, chunk), "rb") as chunk_file:
-                        for line in chunk_file:
-                            line = json.loads(line.strip())
-                            for x in _range:
-                                try:
-                                    value = str(line[line_map[x]])
-                                except KeyError:
-                                    try:
-                                        value = str(data_item.default_values[line_map[x]])
-                                    except KeyError:
-                                        value = str()
-                                _line.append(value)
-                            line = "{}\n".format(data_item.delimiter.join(_line)).encode()
-                            file.write(line)
-                            _line.clear()
-                        file.flush()
+            progress.phase(models.JobPhase.fetch)
+            self.__fetch(
+                data_item=data_item,
+                ranges=[(src_id, source["start"], True) for src_id, source in data_item.sources.items()],
+                chunks=chunks,
+                types=types,
+                progress=progress
+            )
+            self.__set_columns(data_item=data_item, types=types)
+            progress.phase(models.JobPhase.render)
+            self.__render(data_item=data_item, chunks=chunks, header=True, progress=progress)
             self.purge_tmp(chunks)
-            checksum = hashlib.sha256()
-            for _file in data_item.files:
-                with open(os.path.join(self.__data_path, _file), "rb") as file:
-                    buffer = file.read(65536)
-                    while buffer:
-                        checksum.update(buffer)
-                        buffer = file.read(65536)
-            data_item.checksum = checksum.hexdigest()
+            progress.phase(models.JobPhase.checksum)
+            self.__checksum(data_item)
+            progress.finish()
+            data_item.created = "{}Z".format(datetime.datetime.utcnow().isoformat())
+            return data_item
+        except Exception as ex:
+            self.purge_tmp(chunks)
+            self.__remove_files(data_item.files)
+            raise ex
+
+    def update(self, data_item: models.DataItem, progress: typing.Optional[util.Progress] = None) -> models.DataItem:
+        progress = progress or util.Progress()
+        if not data_item.files or not data_item.columns or not data_item.sources or data_item.compressed != self.__compression:
+            logger.debug("no compatible previous build for '{}' - creating new data".format(data_item.source_id))
+            return self.create(data_item, progress)
+        data_item = copy.deepcopy(data_item)
+        if data_item.file_info is None:
+            data_item.file_info = dict()
+        if data_item.compressed and not data_item.codec:
+            data_item.codec = models.Codec.gzip
+        old_files = set(data_item.files)
+        chunks = list()
+        types = dict()
+        ranges = list()
+        try:
+            mapped_years = set()
+            for source in data_item.sources.values():
+                mapped_years.update(source["year_map"].values())
+            progress.phase(models.JobPhase.export_lookup)
+            src_ids = self.__get_export_ids(data_item.source_id)
+            progress.phase(models.JobPhase.probe)
+            timestamps = self.__get_timestamps(src_ids - data_item.sources.keys())
+            timestamps.update(self.__get_timestamps(src_ids & data_item.sources.keys(), start=False))
+            for src_id in sorted(timestamps.keys() & data_item.sources.keys()):
+                source = data_item.sources[src_id]
+                end = timestamps[src_id][1]
+                if datetime.datetime.strptime(end, self.__time_format) <= datetime.datetime.strptime(source["end"], self.__time_format):
+                    continue
+                year_map = gen_year_map(
+                    start=int(source["start"].split("-", 1)[0]),
+                    end=int(end.split("-", 1)[0]),
+                    base=int(source["year_map"][source["start"].split("-", 1)[0]])
+                )
+                new_years = set(year_map.values()) - set(source["year_map"].values())
+                if new_years & mapped_years:
+                    logger.info("year mapping of '{}' collides with other sources - creating new data".format(src_id))
+                    return self.create(data_item, progress)
+                mapped_years.update(new_years)
+                ranges.append((src_id, source["end"], False))
+                source["end"] = end
+                source["year_map"] = year_map
+            start_year = max(int(year) for year in mapped_years) + 1
+            for src_id in sorted(timestamps.keys() - data_item.sources.keys()):
+                start_year = self.__add_source(
+                    data_item=data_item,
+                    src_id=src_id,
+                    start=timestamps[src_id][0],
+                    end=timestamps[src_id][1],
+                    start_year=start_year
+                )
+                mapped_years.update(data_item.sources[src_id]["year_map"].values())
+                ranges.append((src_id, data_item.sources[src_id]["start"], True))
+            ranges.sort(key=lambda item: item[0])
+            if not all(inclusive for _, _, inclusive in ranges) and not self.__is_ordered(data_item, old_files):
+                logger.info("files of '{}' can't be ordered by time - creating new data".format(data_item.source_id))
+                return self.create(data_item, progress)
+            progress.phase(models.JobPhase.fetch)
+            self.__fetch(data_item=data_item, ranges=ranges, chunks=chunks, types=types, progress=progress)
+            types.pop(data_item.time_field, None)
+            if not types.keys() <= set(data_item.columns):
+                logger.info("new columns found for '{}' - creating new data".format(data_item.source_id))
+                self.purge_tmp(chunks)
+                chunks.clear()
+                return self.create(data_item, progress)
+            if not chunks:
+                logger.debug("no new data for '{}'".format(data_item.source_id))
+                progress.finish()
+                return data_item
+            column_types = data_item.column_types or dict()
+            for column in data_item.columns:
+                types.setdefault(column, set()).add(column_types.get(column))
+            self.__set_columns(data_item=data_item, types=types)
+            if data_item.format in (models.FileFormat.parquet, models.FileFormat.arrow) and data_item.column_types != column_types:
+                logger.info("column types of '{}' changed - creating new data".format(data_item.source_id))
+                self.purge_tmp(chunks)
+                chunks.clear()
+                return self.create(data_item, progress)
+            progress.phase(models.JobPhase.render)
+            self.__render(data_item=data_item, chunks=chunks, header=not self.__single_header, progress=progress)
+            self.purge_tmp(chunks)
+            if self.__is_ordered(data_item, data_item.files):
+                data_item.files.sort(key=lambda file: self.__parse_time(data_item.file_info[file]["first"]))
+            progress.phase(models.JobPhase.checksum)
+            self.__checksum(data_item)
+            progress.finish()
+            logger.debug("appended {} files to '{}'".format(len(data_item.files) - len(old_files), data_item.source_id))
             data_item.created = "{}Z".format(datetime.datetime.utcnow().isoformat())
             return data_item
         except Exception as ex:
             self.purge_tmp(chunks)
+            self.__remove_files(set(data_item.files) - old_files)
+            raise ex
+
+    def __remove_files(self, files: typing.Iterable):
+        for file in files:
             try:
-                for file in data_item.files:
-                    os.remove(os.path.join(self.__data_path, file))
+                os.remove(os.path.join(self.__data_path, file))
             except Exception:
                 pass
-            raise ex
 
     def purge_tmp(self, items=None):
         for file in items or os.listdir(self.__tmp_path):
@@ -229,5 +855,87 @@ class Data:
         path = os.path.join(self.__data_path, file_name)
         return open(path, 'rb'), os.path.getsize(path)
 
+    def get_size(self, file_name) -> int:
+        return os.path.getsize(os.path.join(self.__data_path, file_name))
+
+    def open_segments(self, segments: typing.Sequence[typing.Tuple[str, int, int]], start: int = 0, length: typing.Optional[int] = None) -> util.ConcatReader:
+        return util.ConcatReader(
+            segments=[(os.path.join(self.__data_path, file_name), offset, size) for file_name, offset, size in segments],
+            start=start,
+            length=length
+        )
+
+    @staticmethod
+    def __is_ordered(data_item: models.DataItem, files: typing.Iterable[str]) -> bool:
+        return all((data_item.file_info.get(file) or dict()).get("first") for file in files)
+
+    def __parse_time(self, timestamp: typing.Optional[str]) -> typing.Optional[datetime.datetime]:
+        return datetime.datetime.strptime(timestamp, self.__time_format) if timestamp else None
+
+    def __get_blocks(self, data_item: models.DataItem, start: typing.Optional[datetime.datetime], end: typing.Optional[datetime.datetime]) -> list:
+        blocks = list()
+        for file in data_item.files:
+            file_info = data_item.file_info[file]
+            first = self.__parse_time(file_info.get("first"))
+            last = self.__parse_time(file_info.get("last"))
+            if (start and last and last < start) or (end and first and first > end):
+                continue
+            index = file_info.get("index") or [[None, file_info["header"]]]
+            for x in range(len(index)):
+                block_start = self.__parse_time(index[x][0])
+                block_end = self.__parse_time(index[x + 1][0]) if x + 1 < len(index) else last
+                if start and block_end and block_end < start:
+                    continue
+                if end and block_start and block_start > end:
+                    break
+                inside = (not start or (block_start and block_start >= start)) and (not end or (block_end and block_end <= end))
+                offset = index[x][1]
+                blocks.append((file, offset, (index[x + 1][1] if x + 1 < len(index) else file_info["size"]) - offset, not inside))
+        return blocks
+
+    def query(self, data_item: models.DataItem, start: typing.Optional[str] = None, end: typing.Optional[str] = None, columns: typing.Optional[list] = None) -> typing.Iterator[bytes]:
+        if data_item.format != models.FileFormat.csv:
+            raise RuntimeError("format '{}' of '{}' can't be queried".format(data_item.format, data_item.source_id))
+        if not is_indexed(data_item):
+            raise RuntimeError("data of '{}' predates queries and must be recreated".format(data_item.source_id))
+        start = self.__parse_time(start)
+        end = self.__parse_time(end)
+        for column in columns or list():
+            if column not in data_item.columns:
+                raise ValueError("unknown column '{}'".format(column))
+        columns = [data_item.time_field, *(column for column in columns or data_item.columns if column != data_item.time_field)]
+        positions = [data_item.columns.index(column) for column in columns]
+        project = positions != list(range(len(data_item.columns)))
+        codec = data_item.codec or (models.Codec.gzip if data_item.compressed else None)
+        delimiter = data_item.delimiter
+        blocks = self.__get_blocks(data_item=data_item, start=start, end=end)
+
+        def stream():
+            yield "{}\n".format(delimiter.join(columns)).encode()
+            for file, offset, length, check in blocks:
+                with open(os.path.join(self.__data_path, file), "rb") as _file:
+                    _file.seek(offset)
+                    data = _file.read(length)
+                if codec:
+                    data = util.decompress(data, codec)
+                if not check and not project:
+                    yield data
+                    continue
+                lines = list()
+                for line in data.decode().split("\n"):
+                    if not line:
+                        continue
+                    values = line.split(delimiter)
+                    if check:
+                        timestamp = self.__parse_time(values[0])
+                        if (start and timestamp < start) or (end and timestamp > end):
+                            continue
+                    lines.append(delimiter.join([values[pos] for pos in positions]) if project else line)
+                if lines:
+                    lines.append(str())
+                    yield "\n".join(lines).encode()
+
+        return stream()
+
     def remove(self, file_name):
         os.remove(os.path.join(self.__data_path, file_name))
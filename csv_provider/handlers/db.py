@@ -14,45 +14,163 @@
    limitations under the License.
 """
 
-__all__ = ("DB",)
+__all__ = ("DB", "Batch", "Snapshot")
 
 
 from ..logger import getLogger
+from .. import metrics
 import plyvel
-import threading
+import contextlib
+import itertools
+import binascii
+import base64
+import typing
+import time
 
 logger = getLogger(__name__.split(".", 1)[-1])
 
 
+def encode_cursor(key: bytes) -> str:
+    return base64.urlsafe_b64encode(key).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> bytes:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("invalid cursor '{}'".format(cursor))
+
+
+@contextlib.contextmanager
+def timed(operation: str, db: bytes):
+    start = time.perf_counter()
+    yield
+    metrics.observe("db_operation_seconds", time.perf_counter() - start, operation=operation, partition=db.decode().rstrip("-"))
+
+
+def iterate(source, db: bytes, cursor: typing.Optional[str] = None, include_value: bool = False) -> typing.Iterator:
+    stop = db[:-1] + bytes((db[-1] + 1,))
+    if cursor:
+        it = source.iterator(start=db + decode_cursor(cursor), include_start=False, stop=stop, include_value=include_value)
+    else:
+        it = source.iterator(start=db, stop=stop, include_value=include_value)
+    with it:
+        if include_value:
+            for key, value in it:
+                yield key[len(db):], value
+        else:
+            for key in it:
+                yield key[len(db):]
+
+
+def page(source, db: bytes, limit: int, cursor: typing.Optional[str] = None, include_value: bool = False) -> typing.Tuple[list, typing.Optional[str]]:
+    items = list(itertools.islice(iterate(source, db, cursor, include_value), limit + 1))
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1][0] if include_value else items[-1])
+    return items, None
+
+
+class Batch:
+    def __init__(self):
+        self.operations: typing.List[typing.Tuple[bytes, bytes, typing.Optional[bytes]]] = list()
+
+    def put(self, db: bytes, key: bytes, value: bytes):
+        self.operations.append((db, key, value))
+
+    def delete(self, db: bytes, key: bytes):
+        self.operations.append((db, key, None))
+
+
+class Snapshot:
+    def __init__(self, snapshot):
+        self.__snapshot = snapshot
+
+    def get(self, db: bytes, key: bytes) -> bytes:
+        with timed("get", db):
+            value = self.__snapshot.get(db + key)
+        if not value:
+            raise KeyError(key)
+        return value
+
+    def list_keys(self, db: bytes) -> list:
+        with timed("list_keys", db):
+            return [key.decode() for key in iterate(self.__snapshot, db)]
+
+
 class DB:
     def __init__(self, st_path):
         self.__kvs = plyvel.DB(st_path, create_if_missing=True)
-        self.__lock = threading.Lock()
+        self.__listeners: typing.Dict[bytes, typing.List[typing.Callable[[bytes], None]]] = dict()
+
+    def __notify(self, db: bytes, key: bytes):
+        for callback in self.__listeners.get(db, ()):
+            try:
+                callback(key)
+            except Exception as ex:
+                logger.error("listener for '{}' failed - {}".format(db.decode(), ex))
+
+    def add_listener(self, db: bytes, callback: typing.Callable[[bytes], None]):
+        self.__listeners.setdefault(db, list()).append(callback)
 
     def put(self, db: bytes, key: bytes, value: bytes):
-        with self.__lock:
-            partition = self.__kvs.prefixed_db(db)
-            partition.put(key, value)
+        with timed("put", db):
+            self.__kvs.put(db + key, value)
+        self.__notify(db, key)
 
     def get(self, db: bytes, key: bytes) -> bytes:
-        with self.__lock:
-            partition = self.__kvs.prefixed_db(db)
-            value = partition.get(key)
-            if not value:
-                raise KeyError(key)
-            return value
+        with timed("get", db):
+            value = self.__kvs.get(db + key)
+        if not value:
+            raise KeyError(key)
+        return value
 
     def delete(self, db: bytes, key: bytes):
-        with self.__lock:
-            partition = self.__kvs.prefixed_db(db)
-            partition.delete(key)
+        with timed("delete", db):
+            self.__kvs.delete(db + key)
+        self.__notify(db, key)
 
     def list_keys(self, db: bytes) -> list:
-        with self.__lock:
-            partition = self.__kvs.prefixed_db(db)
-            with partition.iterator() as it:
-                return [key.decode() for key, _ in it]
+        with timed("list_keys", db):
+            return [key.decode() for key in iterate(self.__kvs, db)]
+
+    def page_keys(self, db: bytes, limit: int, cursor: typing.Optional[str] = None) -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+        with timed("list_keys", db):
+            keys, cursor = page(self.__kvs, db, limit, cursor)
+        return [key.decode() for key in keys], cursor
+
+    def list_items(self, db: bytes) -> typing.List[typing.Tuple[str, bytes]]:
+        with timed("list_items", db):
+            return [(key.decode(), value) for key, value in iterate(self.__kvs, db, include_value=True)]
+
+    def page_items(self, db: bytes, limit: int, cursor: typing.Optional[str] = None) -> typing.Tuple[typing.List[typing.Tuple[str, bytes]], typing.Optional[str]]:
+        with timed("list_items", db):
+            items, cursor = page(self.__kvs, db, limit, cursor, include_value=True)
+        return [(key.decode(), value) for key, value in items], cursor
+
+    @contextlib.contextmanager
+    def batch(self) -> typing.Iterator[Batch]:
+        batch = Batch()
+        yield batch
+        if not batch.operations:
+            return
+        with timed("batch", b"+".join(sorted({db.rstrip(b"-") for db, _, _ in batch.operations}))):
+            with self.__kvs.write_batch(transaction=True) as write_batch:
+                for db, key, value in batch.operations:
+                    if value is None:
+                        write_batch.delete(db + key)
+                    else:
+                        write_batch.put(db + key, value)
+        for db, key, _ in batch.operations:
+            self.__notify(db, key)
+
+    @contextlib.contextmanager
+    def snapshot(self) -> typing.Iterator[Snapshot]:
+        snapshot = self.__kvs.snapshot()
+        try:
+            yield Snapshot(snapshot)
+        finally:
+            snapshot.close()
 
     def close(self):
-        with self.__lock:
-            self.__kvs.close()
\ No newline at end of file
+        self.__kvs.close()
@@ -0,0 +1,70 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("data_item_fields", "large_fields", "summary_fields", "store_data_item", "load_data_item", "delete_data_item", "summarize_data_item")
+
+
+from .. import models
+from .db import DB, Batch
+import json
+import typing
+
+
+data_item_fields = tuple(field for field, _ in models.DataItem())
+
+large_fields = ("sources", "columns", "column_types", "default_values", "files", "file_info")
+
+summary_fields = ("source_id", "size", "created", "checksum")
+
+
+def field_key(source_id: bytes, field: str) -> bytes:
+    return source_id + b"/" + field.encode()
+
+
+def store_data_item(batch: Batch, data_item: models.DataItem):
+    record = dict(data_item)
+    key = data_item.source_id.encode()
+    for field in large_fields:
+        batch.put(b"fields-", field_key(key, field), json.dumps(record.pop(field)).encode())
+    batch.put(b"data-", key, json.dumps(record).encode())
+
+
+def load_data_item(db_handler: DB, source_id: str, fields: typing.Optional[typing.Sequence[str]] = None) -> dict:
+    key = source_id.encode()
+    with db_handler.snapshot() as snapshot:
+        record = json.loads(snapshot.get(b"data-", key))
+        for field in large_fields if fields is None else fields:
+            if field in large_fields and field not in record:
+                try:
+                    record[field] = json.loads(snapshot.get(b"fields-", field_key(key, field)))
+                except KeyError:
+                    pass
+    if fields is None:
+        return record
+    record = dict(models.DataItem(record))
+    return {field: record[field] for field in fields}
+
+
+def delete_data_item(batch: Batch, source_id: str):
+    key = source_id.encode()
+    batch.delete(b"data-", key)
+    for field in large_fields:
+        batch.delete(b"fields-", field_key(key, field))
+
+
+def summarize_data_item(value: bytes) -> dict:
+    record = json.loads(value)
+    return {field: record.get(field) for field in summary_fields}
@@ -14,11 +14,11 @@
    limitations under the License.
 """
 
-__all__ = ("Jobs",)
+__all__ = ("Jobs", "WorkerPool")
 
 
 from ..logger import getLogger
-from .. import models
+from .. import models, util, metrics
 from .. import handlers
 import threading
 import queue
@@ -28,8 +28,12 @@ import datetime
 import json
 import time
 import multiprocessing
+import multiprocessing.connection
+import multiprocessing.util
 import signal
 import sys
+import os
+import resource
 
 
 logger = getLogger(__name__.split(".", 1)[-1])
@@ -40,6 +44,23 @@ def handle_sigterm(signo, stack_frame):
     sys.exit(0)
 
 
+def get_rss() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Event:
+    wakeup = "wakeup"
+    started = "started"
+    progress = "progress"
+    metrics = "metrics"
+    result = "result"
+    exited = "exited"
+
+
 class Result:
     def __init__(self):
         self.data_item: typing.Optional[models.DataItem] = None
@@ -48,68 +69,180 @@ class Result:
 
 
 class Worker(multiprocessing.Process):
-    def __init__(self, job: models.Job, data_item: models.DataItem, data_handler: handlers.Data):
-        super().__init__(name="jobs-worker-{}".format(job.id), daemon=True)
-        self.__data_item = data_item
+    def __init__(self, data_handler: handlers.Data, tasks: multiprocessing.Queue, events: multiprocessing.SimpleQueue, max_jobs: int, max_rss: int, progress_interval: float):
+        super().__init__(name="jobs-worker", daemon=False)
         self.__data_handler = data_handler
-        self.__job = job
-        self.result = multiprocessing.Queue()
+        self.__tasks = tasks
+        self.__events = events
+        self.__max_jobs = max_jobs
+        self.__max_rss = max_rss
+        self.__progress_interval = progress_interval
 
-    def run(self) -> None:
-        signal.signal(signal.SIGTERM, handle_sigterm)
-        signal.signal(signal.SIGINT, handle_sigterm)
+    def __send_metrics(self):
+        observations = metrics.drain()
+        if observations:
+            self.__events.put((Event.metrics, observations))
+
+    def __report(self, job_id: str, progress_info: dict):
+        self.__events.put((Event.progress, job_id, progress_info))
+        self.__send_metrics()
+
+    def __run_job(self, job: models.Job, data_item: models.DataItem) -> Result:
         result_obj = Result()
+        progress = util.Progress(
+            callback=lambda progress_info: self.__report(job.id, progress_info),
+            interval=self.__progress_interval
+        )
         try:
-            logger.debug("starting job '{}' ...".format(self.__job.id))
-            self.__job.status = models.JobStatus.running
+            logger.debug("starting job '{}' ...".format(job.id))
+            job.status = models.JobStatus.running
             try:
-                old_files = self.__data_item.files
+                old_files = data_item.files
             except Exception:
                 old_files = None
-            result_obj.data_item = self.__data_handler.create(self.__data_item.source_id, self.__data_item.time_field, self.__data_item.delimiter)
+            if job.incremental:
+                result_obj.data_item = self.__data_handler.update(data_item, progress)
+            else:
+                result_obj.data_item = self.__data_handler.create(data_item, progress)
             if old_files:
                 try:
-                    for old_file in old_files:
+                    for old_file in set(old_files) - set(result_obj.data_item.files):
                         try:
                             self.__data_handler.remove(old_file)
                         except Exception as ex:
-                            logger.warning("{}: could not remove old file '{}' - {}".format(self.__job.id, old_file, ex))
+                            logger.warning("{}: could not remove old file '{}' - {}".format(job.id, old_file, ex))
                 except Exception as ex:
-                    logger.warning("{}: could not remove old files - {}".format(self.__job.id, ex))
-            self.__job.status = models.JobStatus.finished
-            logger.debug("{}: completed successfully".format(self.__job.id))
+                    logger.warning("{}: could not remove old files - {}".format(job.id, ex))
+            job.status = models.JobStatus.finished
+            logger.debug("{}: completed successfully".format(job.id))
         except Exception as ex:
-            self.__job.status = models.JobStatus.failed
-            self.__job.reason = str(ex)
-            logger.error("{}: failed - {}".format(self.__job.id, ex))
+            job.status = models.JobStatus.failed
+            job.reason = str(ex)
+            logger.error("{}: failed - {}".format(job.id, ex))
             result_obj.error = True
-        result_obj.job = self.__job
-        self.result.put(result_obj)
+        job.progress = progress.get()
+        result_obj.job = job
+        return result_obj
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        signal.signal(signal.SIGINT, handle_sigterm)
+        metrics.forward()
+        count = 0
+        while True:
+            task = self.__tasks.get()
+            if task is None:
+                break
+            job, data_item = task
+            self.__events.put((Event.started, job.id, self.pid))
+            result_obj = self.__run_job(job, data_item)
+            self.__send_metrics()
+            self.__events.put((Event.result, result_obj))
+            count += 1
+            if self.__max_jobs > 0 and count >= self.__max_jobs:
+                logger.debug("worker '{}' completed {} jobs - recycling".format(self.pid, count))
+                break
+            if self.__max_rss > 0 and get_rss() > self.__max_rss * 1024 * 1024:
+                logger.debug("worker '{}' exceeds {} MB - recycling".format(self.pid, self.__max_rss))
+                break
+
+
+class WorkerPool(multiprocessing.Process):
+    def __init__(self, data_handler: handlers.Data, size: int, max_jobs: int, max_rss: int, progress_interval: float):
+        super().__init__(name="jobs-worker-pool", daemon=False)
+        self.__data_handler = data_handler
+        self.__size = max(size, 1)
+        self.__max_jobs = max_jobs
+        self.__max_rss = max_rss
+        self.__progress_interval = progress_interval
+        self.tasks = multiprocessing.Queue()
+        self.events = multiprocessing.SimpleQueue()
+
+    def start(self) -> None:
+        super().start()
+        multiprocessing.util.Finalize(self, self.terminate, exitpriority=10)
+
+    def __stop(self, signo, stack_frame):
+        logger.debug("got signal '{}' - stopping workers ...".format(signo))
+        self.__stopped = True
+
+    def run(self) -> None:
+        self.__stopped = False
+        signal.signal(signal.SIGTERM, self.__stop)
+        signal.signal(signal.SIGINT, self.__stop)
+        parent_pid = os.getppid()
+        workers: typing.Dict[int, Worker] = dict()
+        try:
+            while not self.__stopped and os.getppid() == parent_pid:
+                while len(workers) < self.__size and not self.__stopped:
+                    worker = Worker(
+                        data_handler=self.__data_handler,
+                        tasks=self.tasks,
+                        events=self.events,
+                        max_jobs=self.__max_jobs,
+                        max_rss=self.__max_rss,
+                        progress_interval=self.__progress_interval
+                    )
+                    worker.start()
+                    workers[worker.sentinel] = worker
+                for sentinel in multiprocessing.connection.wait(list(workers), timeout=1):
+                    worker = workers.pop(sentinel)
+                    worker.join()
+                    if worker.exitcode:
+                        logger.error("worker '{}' quit with exitcode '{}'".format(worker.pid, worker.exitcode))
+                    self.events.put((Event.exited, worker.pid, worker.exitcode))
+                    worker.close()
+        finally:
+            for worker in workers.values():
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers.values():
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.kill()
 
 
 class Jobs(threading.Thread):
-    def __init__(self, db_handler: handlers.DB, data_handler: handlers.Data, check_delay: typing.Union[int, float], max_jobs: int):
+    def __init__(self, db_handler: handlers.DB, worker_pool: WorkerPool, check_delay: typing.Union[int, float], max_jobs: int):
         super().__init__(name="jobs-handler", daemon=True)
         self.__db_handler = db_handler
-        self.__data_handler = data_handler
+        self.__worker_pool = worker_pool
         self.__check_delay = check_delay
         self.__max_jobs = max_jobs
-        self.__job_queue = queue.Queue()
+        self.__job_queue = queue.PriorityQueue()
         self.__job_pool: typing.Dict[str, models.Job] = dict()
-        self.__worker_pool: typing.Dict[str, Worker] = dict()
-
-    def create(self, source_id: str) -> str:
-        for job in self.__job_pool.values():
-            if job.source_id == source_id:
-                logger.debug("job for source '{}' already exists".format(source_id))
-                return job.id
-        job = models.Job()
-        job.id = uuid.uuid4().hex
-        job.source_id = source_id
-        job.created = "{}Z".format(datetime.datetime.utcnow().isoformat())
+        self.__running: typing.Dict[str, typing.Optional[int]] = dict()
+        self.__lock = threading.Lock()
+        self.__resume()
+
+    def __enqueue(self, job: models.Job):
         self.__job_pool[job.id] = job
+        self.__job_queue.put_nowait((-job.priority, job.created, job.id))
+
+    def __resume(self):
+        with self.__db_handler.snapshot() as snapshot:
+            for job_id in snapshot.list_keys(b"queue-"):
+                job = models.Job(json.loads(snapshot.get(b"queue-", job_id.encode())))
+                job.status = models.JobStatus.pending
+                self.__enqueue(job)
+                logger.info("resuming job '{}' for source '{}'".format(job.id, job.source_id))
+
+    def create(self, source_id: str, incremental: bool = False, priority: int = 0) -> str:
+        with self.__lock:
+            for job in self.__job_pool.values():
+                if job.source_id == source_id:
+                    logger.debug("job for source '{}' already exists".format(source_id))
+                    return job.id
+            job = models.Job()
+            job.id = uuid.uuid4().hex
+            job.source_id = source_id
+            job.incremental = incremental
+            job.priority = priority
+            job.created = "{}Z".format(datetime.datetime.utcnow().isoformat())
+            self.__db_handler.put(b"queue-", job.id.encode(), json.dumps(dict(job)).encode())
+            self.__enqueue(job)
         logger.debug("created job for source '{}'".format(source_id))
-        self.__job_queue.put_nowait(job.id)
+        self.__worker_pool.events.put((Event.wakeup,))
         return job.id
 
     def get_job(self, job_id: str) -> models.Job:
@@ -118,34 +251,67 @@ class Jobs(threading.Thread):
     def list_jobs(self) -> list:
         return list(self.__job_pool.keys())
 
+    def __start_jobs(self):
+        while len(self.__running) < self.__max_jobs:
+            try:
+                _, _, job_id = self.__job_queue.get_nowait()
+            except queue.Empty:
+                break
+            job = self.__job_pool[job_id]
+            try:
+                data_item = models.DataItem(handlers.load_data_item(self.__db_handler, job.source_id))
+            except Exception as ex:
+                job.status = models.JobStatus.failed
+                job.reason = "could not load data resource - {}".format(ex)
+                logger.error("{}: failed - {}".format(job_id, job.reason))
+                self.__finish(job)
+                continue
+            job.status = models.JobStatus.running
+            self.__db_handler.put(b"queue-", job_id.encode(), json.dumps(dict(job)).encode())
+            self.__running[job_id] = None
+            self.__worker_pool.tasks.put((job, data_item))
+
+    def __finish(self, job: models.Job, data_item: typing.Optional[models.DataItem] = None):
+        with self.__db_handler.batch() as batch:
+            batch.put(b"jobs-", job.id.encode(), json.dumps(dict(job)).encode())
+            if data_item:
+                handlers.store_data_item(batch, data_item)
+            batch.delete(b"queue-", job.id.encode())
+        self.__running.pop(job.id, None)
+        with self.__lock:
+            del self.__job_pool[job.id]
+
+    def __handle_event(self, event: tuple):
+        if event[0] == Event.started:
+            self.__running[event[1]] = event[2]
+        elif event[0] == Event.progress:
+            if event[1] in self.__job_pool:
+                self.__job_pool[event[1]].progress = event[2]
+        elif event[0] == Event.metrics:
+            metrics.apply(event[1])
+        elif event[0] == Event.result:
+            res: Result = event[1]
+            if res.job.progress:
+                metrics.observe("job_seconds", res.job.progress["elapsed"], status=res.job.status, incremental=str(res.job.incremental).lower())
+                for phase, seconds in res.job.progress["phases"].items():
+                    metrics.observe("job_phase_seconds", seconds, phase=phase)
+            self.__finish(res.job, None if res.error else res.data_item)
+        elif event[0] == Event.exited:
+            for job_id, pid in list(self.__running.items()):
+                if pid == event[1]:
+                    job = self.__job_pool[job_id]
+                    job.status = models.JobStatus.failed
+                    job.reason = "worker quit with exitcode '{}'".format(event[2])
+                    logger.error("{}: failed - {}".format(job_id, job.reason))
+                    self.__finish(job)
+
     def run(self):
         while True:
             try:
-                if len(self.__worker_pool) < self.__max_jobs:
-                    try:
-                        job_id = self.__job_queue.get(timeout=self.__check_delay)
-                        worker = Worker(
-                            job=self.__job_pool[job_id],
-                            data_item=models.DataItem(json.loads(self.__db_handler.get(b"data-", self.__job_pool[job_id].source_id.encode()))),
-                            data_handler=self.__data_handler
-                        )
-                        self.__worker_pool[job_id] = worker
-                        worker.start()
-                    except queue.Empty:
-                        pass
-                else:
-                    time.sleep(self.__check_delay)
-                for job_id in list(self.__worker_pool.keys()):
-                    if not self.__worker_pool[job_id].is_alive():
-                        try:
-                            res = self.__worker_pool[job_id].result.get(timeout=5)
-                            self.__db_handler.put(b"jobs-", res.job.id.encode(), json.dumps(dict(res.job)).encode())
-                            if not res.error:
-                                self.__db_handler.put(b"data-", res.data_item.source_id.encode(), json.dumps(dict(res.data_item)).encode())
-                        except queue.Empty:
-                            logger.error("job '{}' quit with exitcode '{}'".format(job_id, self.__worker_pool[job_id].exitcode))
-                        self.__worker_pool[job_id].close()
-                        del self.__worker_pool[job_id]
-                        del self.__job_pool[job_id]
+                self.__start_jobs()
+                metrics.observe("jobs_queued", self.__job_queue.qsize())
+                metrics.observe("jobs_running", len(self.__running))
+                self.__handle_event(self.__worker_pool.events.get())
             except Exception as ex:
                 logger.error("job handling failed - {}".format(ex))
+                time.sleep(self.__check_delay)
@@ -0,0 +1,251 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("Upstream", "Limiter")
+
+
+from ..logger import getLogger
+from .. import metrics
+import requests
+import requests.adapters
+import auth_client
+import multiprocessing
+import threading
+import typing
+import random
+import base64
+import json
+import time
+import os
+
+
+logger = getLogger(__name__.split(".", 1)[-1])
+
+
+def get_token_expiry(token: str) -> typing.Optional[float]:
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+def is_overload(ex: Exception, status: typing.Optional[int]) -> bool:
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(ex, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Limiter:
+    __limit, __tokens, __refilled, __decreased = range(4)
+
+    def __init__(self, concurrency: int, rate: float, latency: float):
+        self.__rate = rate
+        self.__latency = latency
+        self.__concurrency = max(concurrency, 0)
+        self.__condition = multiprocessing.Condition()
+        self.__slots = multiprocessing.RawArray("q", self.__concurrency)
+        self.__state = multiprocessing.RawArray("d", 4)
+        self.__state[Limiter.__limit] = self.__concurrency
+        self.__state[Limiter.__tokens] = max(rate, 1.0)
+        self.__state[Limiter.__refilled] = time.monotonic()
+        if self.__concurrency:
+            metrics.observe("upstream_concurrency_limit", self.__concurrency)
+
+    def __get_slot(self) -> typing.Optional[int]:
+        if not self.__concurrency:
+            return -1
+        active = 0
+        free = None
+        for slot in range(self.__concurrency):
+            pid = self.__slots[slot]
+            if pid and not is_alive(pid):
+                logger.warning("reclaiming upstream slot of exited process '{}'".format(pid))
+                self.__slots[slot] = pid = 0
+            if pid:
+                active += 1
+            elif free is None:
+                free = slot
+        if active >= int(self.__state[Limiter.__limit]):
+            return None
+        return free
+
+    def __get_delay(self) -> float:
+        if self.__rate <= 0:
+            return 0
+        now = time.monotonic()
+        self.__state[Limiter.__tokens] = min(
+            self.__state[Limiter.__tokens] + (now - self.__state[Limiter.__refilled]) * self.__rate,
+            max(self.__rate, 1.0)
+        )
+        self.__state[Limiter.__refilled] = now
+        if self.__state[Limiter.__tokens] >= 1:
+            return 0
+        return (1 - self.__state[Limiter.__tokens]) / self.__rate
+
+    def acquire(self) -> int:
+        start = time.monotonic()
+        with self.__condition:
+            while True:
+                slot = self.__get_slot()
+                delay = 1.0 if slot is None else self.__get_delay()
+                if not delay:
+                    break
+                self.__condition.wait(delay)
+            if self.__rate > 0:
+                self.__state[Limiter.__tokens] -= 1
+            if slot >= 0:
+                self.__slots[slot] = os.getpid()
+        metrics.observe("upstream_admission_seconds", time.monotonic() - start)
+        return slot
+
+    def release(self, slot: int, seconds: float, overload: bool):
+        with self.__condition:
+            if slot >= 0:
+                self.__slots[slot] = 0
+            limit = self.__state[Limiter.__limit]
+            if self.__concurrency:
+                if overload or (self.__latency > 0 and seconds > self.__latency):
+                    now = time.monotonic()
+                    if limit > 1 and now - self.__state[Limiter.__decreased] >= max(self.__latency, 1.0):
+                        self.__state[Limiter.__limit] = max(limit / 2, 1.0)
+                        self.__state[Limiter.__decreased] = now
+                        logger.warning("upstream overloaded - lowering concurrency limit to '{}'".format(int(self.__state[Limiter.__limit])))
+                elif limit < self.__concurrency:
+                    self.__state[Limiter.__limit] = min(limit + 1 / limit, self.__concurrency)
+            if int(limit) != int(self.__state[Limiter.__limit]):
+                metrics.observe("upstream_concurrency_limit", int(self.__state[Limiter.__limit]))
+            self.__condition.notify_all()
+
+
+class Upstream:
+    def __init__(self, auth_handler: auth_client.Client, usr_id: str, pool_size: int, retries: int, backoff: float, backoff_max: float, token_ttl: int, connect_timeout: float, read_timeout: float, limiter: typing.Optional[Limiter]):
+        self.__auth_handler = auth_handler
+        self.__usr_id = usr_id
+        self.__pool_size = max(pool_size, 1)
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__backoff_max = backoff_max
+        self.__token_ttl = token_ttl
+        self.__timeout = (connect_timeout, read_timeout)
+        self.__limiter = limiter
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__session: typing.Optional[requests.Session] = None
+        self.__token = None
+        self.__token_expiry = 0
+        self.__stats = dict()
+
+    @property
+    def retries(self) -> int:
+        return self.__retries
+
+    def get_delay(self, retries: int) -> float:
+        return min(self.__backoff * 2 ** (retries - 1), self.__backoff_max) * random.uniform(0.5, 1)
+
+    def __get_session(self) -> requests.Session:
+        with self.__lock:
+            if self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=self.__pool_size)
+                self.__session.mount("http://", adapter)
+                self.__session.mount("https://", adapter)
+                self.__session.headers.update({"Accept-Encoding": "gzip, deflate", "X-UserId": self.__usr_id})
+                self.__stats = dict()
+            return self.__session
+
+    def __get_token(self) -> str:
+        with self.__lock:
+            if not self.__token or time.time() >= self.__token_expiry:
+                self.__token = self.__auth_handler.get_access_token()
+                expiry = get_token_expiry(self.__token)
+                if expiry:
+                    self.__token_expiry = expiry - 10
+                else:
+                    self.__token_expiry = time.time() + self.__token_ttl
+            return self.__token
+
+    def __invalidate_token(self):
+        with self.__lock:
+            self.__token = None
+
+    def __record(self, name: str, seconds: float, error: bool, retry: bool):
+        metrics.observe("upstream_request_seconds", seconds, name=name, outcome="error" if error else "ok")
+        with self.__lock:
+            if name not in self.__stats:
+                self.__stats[name] = dict(requests=0, errors=0, retries=0, seconds=0.0)
+            stats = self.__stats[name]
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            if error:
+                stats["errors"] += 1
+            if retry:
+                stats["retries"] += 1
+
+    def request(self, name: str, method: str, url: str, limited: bool = False, **kwargs) -> requests.Response:
+        session = self.__get_session()
+        limiter = self.__limiter if limited else None
+        retries = 0
+        while True:
+            slot = None
+            start = time.monotonic()
+            status = None
+            try:
+                headers = {"Authorization": "Bearer " + self.__get_token()}
+                if limiter:
+                    slot = limiter.acquire()
+                    start = time.monotonic()
+                resp = session.request(method=method, url=url, headers=headers, timeout=self.__timeout, **kwargs)
+                status = resp.status_code
+                if resp.status_code == 401:
+                    self.__invalidate_token()
+                if not resp.ok:
+                    resp.close()
+                    raise RuntimeError(resp.status_code)
+            except Exception as ex:
+                seconds = time.monotonic() - start
+                self.__record(name=name, seconds=seconds, error=True, retry=retries > 0)
+                if slot is not None:
+                    limiter.release(slot=slot, seconds=seconds, overload=is_overload(ex, status))
+                if retries >= self.__retries:
+                    raise ex
+                retries += 1
+                metrics.observe("upstream_retries", name=name)
+                delay = self.get_delay(retries)
+                logger.debug("{} request failed - {} - retrying in {:.2f}s ({}/{})".format(name, ex, delay, retries, self.__retries))
+                time.sleep(delay)
+                continue
+            seconds = time.monotonic() - start
+            self.__record(name=name, seconds=seconds, error=False, retry=retries > 0)
+            if limiter:
+                limiter.release(slot=slot, seconds=seconds, overload=False)
+            return resp
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {name: dict(stats) for name, stats in self.__stats.items()}
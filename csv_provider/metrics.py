@@ -0,0 +1,144 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+__all__ = ("registry", "observe", "forward", "drain", "apply", "generate", "content_type")
+
+
+import prometheus_client
+import threading
+import typing
+
+
+registry = prometheus_client.CollectorRegistry()
+
+content_type = prometheus_client.CONTENT_TYPE_LATEST
+
+metrics = {
+    "http_request_seconds": prometheus_client.Histogram(
+        "csv_provider_http_request_duration_seconds",
+        "Latency of API requests.",
+        ("route", "method", "status"),
+        registry=registry
+    ),
+    "http_response_bytes": prometheus_client.Counter(
+        "csv_provider_http_response_bytes",
+        "Bytes of data files served.",
+        ("route",),
+        registry=registry
+    ),
+    "upstream_request_seconds": prometheus_client.Histogram(
+        "csv_provider_upstream_request_duration_seconds",
+        "Latency of requests to upstream APIs.",
+        ("name", "outcome"),
+        registry=registry
+    ),
+    "upstream_retries": prometheus_client.Counter(
+        "csv_provider_upstream_retries",
+        "Retried requests to upstream APIs.",
+        ("name",),
+        registry=registry
+    ),
+    "upstream_admission_seconds": prometheus_client.Histogram(
+        "csv_provider_upstream_admission_duration_seconds",
+        "Time spent waiting for the shared upstream limiter.",
+        registry=registry
+    ),
+    "upstream_concurrency_limit": prometheus_client.Gauge(
+        "csv_provider_upstream_concurrency_limit",
+        "Current limit of concurrent requests to the DB API across all workers.",
+        registry=registry
+    ),
+    "db_operation_seconds": prometheus_client.Histogram(
+        "csv_provider_db_operation_duration_seconds",
+        "Latency of storage operations.",
+        ("operation", "partition"),
+        buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+        registry=registry
+    ),
+    "data_cache_requests": prometheus_client.Counter(
+        "csv_provider_data_cache_requests",
+        "Lookups of data resource metadata in the cache.",
+        ("outcome",),
+        registry=registry
+    ),
+    "job_seconds": prometheus_client.Histogram(
+        "csv_provider_job_duration_seconds",
+        "Duration of jobs.",
+        ("status", "incremental"),
+        buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 10800.0, 21600.0),
+        registry=registry
+    ),
+    "job_phase_seconds": prometheus_client.Histogram(
+        "csv_provider_job_phase_duration_seconds",
+        "Duration of job phases.",
+        ("phase",),
+        buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 10800.0),
+        registry=registry
+    ),
+    "jobs_queued": prometheus_client.Gauge(
+        "csv_provider_jobs_queued",
+        "Jobs waiting for a worker.",
+        registry=registry
+    ),
+    "jobs_running": prometheus_client.Gauge(
+        "csv_provider_jobs_running",
+        "Jobs currently processed by workers.",
+        registry=registry
+    )
+}
+
+_lock = threading.Lock()
+_buffer: typing.Optional[list] = None
+
+
+def observe(metric: str, value: float = 1.0, **labels):
+    with _lock:
+        if _buffer is not None:
+            _buffer.append((metric, labels, value))
+            return
+    apply([(metric, labels, value)])
+
+
+def forward():
+    global _buffer
+    with _lock:
+        _buffer = list()
+
+
+def drain() -> list:
+    global _buffer
+    with _lock:
+        observations = _buffer or list()
+        if _buffer is not None:
+            _buffer = list()
+        return observations
+
+
+def apply(observations: typing.Iterable[typing.Tuple[str, dict, float]]):
+    for metric, labels, value in observations:
+        metric = metrics[metric]
+        if labels:
+            metric = metric.labels(**labels)
+        if isinstance(metric, prometheus_client.Histogram):
+            metric.observe(value)
+        elif isinstance(metric, prometheus_client.Counter):
+            metric.inc(value)
+        else:
+            metric.set(value)
+
+
+def generate() -> bytes:
+    return prometheus_client.generate_latest(registry)
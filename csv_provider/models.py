@@ -19,7 +19,7 @@ import typing
 import simple_struct
 
 
-__all__ = ("Job", "JobStatus", "DataItem")
+__all__ = ("Job", "JobStatus", "JobPhase", "DataItem", "FileFormat", "ColumnType", "Codec", "FilePeriod")
 
 
 class JobStatus:
@@ -30,6 +30,41 @@ class JobStatus:
     aborted = "aborted"
 
 
+class JobPhase:
+    export_lookup = "export_lookup"
+    probe = "probe"
+    fetch = "fetch"
+    render = "render"
+    checksum = "checksum"
+
+
+class FileFormat:
+    csv = "csv"
+    parquet = "parquet"
+    arrow = "arrow"
+
+
+class Codec:
+    gzip = "gzip"
+    zstd = "zstd"
+    lz4 = "lz4"
+
+
+class FilePeriod:
+    hour = "hour"
+    day = "day"
+    month = "month"
+    year = "year"
+
+
+class ColumnType:
+    timestamp = "timestamp"
+    boolean = "boolean"
+    integer = "integer"
+    float = "float"
+    string = "string"
+
+
 @simple_struct.structure
 class Job:
     id = None
@@ -37,6 +72,9 @@ class Job:
     status = JobStatus.pending
     source_id = None
     reason = None
+    incremental = False
+    priority = 0
+    progress: dict = None
 
 
 @simple_struct.structure
@@ -48,7 +86,16 @@ class DataItem:
     size: int = 0
     created: str = None
     columns: list = None
+    column_types: dict = None
     default_values: dict = None
     files: list = None
+    file_info: dict = None
     checksum = None
     compressed = None
+    format: str = FileFormat.csv
+    empty_defaults: bool = False
+    codec: str = None
+    compression_level: int = None
+    file_rows: int = None
+    file_size: int = None
+    file_period: str = None
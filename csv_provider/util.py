@@ -14,12 +14,30 @@
    limitations under the License.
 """
 
-__all__ = ("Compress", )
+__all__ = ("GzipCompressor", "ZstdCompressor", "LZ4Compressor", "compressors", "decompressors", "decompress", "Compress", "Hash", "SpillWriter", "read_spill", "ConcatReader", "Progress", "PageSize", "iter_json_array")
 
 
 import zlib
 import typing
 import os
+import marshal
+import array
+import hashlib
+import functools
+import time
+import json
+import codecs
+import re
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 
 def init_storage(paths: tuple):
@@ -28,14 +46,100 @@ def init_storage(paths: tuple):
             os.makedirs(path)
 
 
+class GzipCompressor:
+    def __init__(self, level: int = -1, threads: int = 0):
+        self.__comp_obj = zlib.compressobj(level=level, wbits=zlib.MAX_WBITS | 16)
+
+    def compress(self, b: bytes) -> bytes:
+        return self.__comp_obj.compress(b)
+
+    def flush(self) -> bytes:
+        return self.__comp_obj.flush()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int = -1, threads: int = 0):
+        if zstandard is None:
+            raise RuntimeError("codec 'zstd' requires zstandard")
+        self.__comp_obj = zstandard.ZstdCompressor(level=level if level >= 0 else 3, threads=threads).compressobj()
+
+    def compress(self, b: bytes) -> bytes:
+        return self.__comp_obj.compress(b)
+
+    def flush(self) -> bytes:
+        return self.__comp_obj.flush()
+
+
+class LZ4Compressor:
+    def __init__(self, level: int = -1, threads: int = 0):
+        if lz4 is None:
+            raise RuntimeError("codec 'lz4' requires lz4")
+        self.__comp_obj = lz4.frame.LZ4FrameCompressor(compression_level=max(level, 0))
+        self.__header = self.__comp_obj.begin()
+
+    def compress(self, b: bytes) -> bytes:
+        data = self.__header + self.__comp_obj.compress(b)
+        self.__header = bytes()
+        return data
+
+    def flush(self) -> bytes:
+        data = self.__header + self.__comp_obj.flush()
+        self.__header = bytes()
+        return data
+
+
+compressors = {
+    "gzip": GzipCompressor,
+    "zstd": ZstdCompressor,
+    "lz4": LZ4Compressor
+}
+
+
+def gzip_decompressobj():
+    return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+
+def zstd_decompressobj():
+    if zstandard is None:
+        raise RuntimeError("codec 'zstd' requires zstandard")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def lz4_decompressobj():
+    if lz4 is None:
+        raise RuntimeError("codec 'lz4' requires lz4")
+    return lz4.frame.LZ4FrameDecompressor()
+
+
+decompressors = {
+    "gzip": gzip_decompressobj,
+    "zstd": zstd_decompressobj,
+    "lz4": lz4_decompressobj
+}
+
+
+def decompress(b: bytes, codec: str = "gzip") -> bytes:
+    data = list()
+    while b:
+        dec_obj = decompressors[codec]()
+        data.append(dec_obj.decompress(b))
+        b = dec_obj.unused_data
+    return b"".join(data)
+
+
 class Compress:
-    def __init__(self, io_obj: typing.BinaryIO, level: int = zlib.Z_DEFAULT_COMPRESSION, method: int= zlib.DEFLATED, wbits: int = zlib.MAX_WBITS | 16, memLevel: int = zlib.DEF_MEM_LEVEL, strategy: int = zlib.Z_DEFAULT_STRATEGY):
+    def __init__(self, io_obj: typing.BinaryIO, codec: str = "gzip", level: int = -1, threads: int = 0):
         self.__io_obj = io_obj
-        self.__comp_obj = zlib.compressobj(level=level, method=method, wbits=wbits, memLevel=memLevel, strategy=strategy)
+        self.__compressor = functools.partial(compressors[codec], level=level, threads=threads)
+        self.__comp_obj = self.__compressor()
 
     def write(self, b: bytes):
         return self.__io_obj.write(self.__comp_obj.compress(b))
 
+    def end_member(self):
+        self.__io_obj.write(self.__comp_obj.flush())
+        self.__comp_obj = self.__compressor()
+
     def flush(self):
         self.__io_obj.write(self.__comp_obj.flush())
         return self.__io_obj.flush()
@@ -46,3 +150,270 @@ class Compress:
 
     def __getattr__(self, attr):
         return getattr(self.__io_obj, attr)
+
+
+class Hash:
+    def __init__(self, io_obj: typing.BinaryIO, algorithm: str = "sha256"):
+        self.__io_obj = io_obj
+        self.__hash_obj = hashlib.new(algorithm)
+
+    def write(self, b: bytes):
+        self.__hash_obj.update(b)
+        return self.__io_obj.write(b)
+
+    def hexdigest(self) -> str:
+        return self.__hash_obj.hexdigest()
+
+    def __getattr__(self, attr):
+        return getattr(self.__io_obj, attr)
+
+
+class SpillWriter:
+    def __init__(self, io_obj: typing.BinaryIO, batch_size: int = 1000):
+        self.__io_obj = io_obj
+        self.__batch_size = batch_size
+        self.__columns = dict()
+        self.__new_columns = list()
+        self.__types = list()
+        self.__layouts = dict()
+        self.__signatures = list()
+        self.__rows = list()
+
+    def write(self, timestamp: str, data: dict):
+        keys = tuple(data)
+        try:
+            layout = self.__layouts[keys]
+        except KeyError:
+            layout = self.__layouts[keys] = len(self.__layouts)
+            self.__signatures.append(set())
+        values = tuple(data.values())
+        self.__signatures[layout].add(tuple(map(type, values)))
+        self.__rows.append((layout, timestamp, values))
+        if len(self.__rows) >= self.__batch_size:
+            self.flush()
+
+    def __get_column(self, key: str) -> int:
+        try:
+            return self.__columns[key]
+        except KeyError:
+            column = self.__columns[key] = len(self.__columns)
+            self.__new_columns.append(key)
+            self.__types.append(set())
+            return column
+
+    def flush(self):
+        if not self.__rows:
+            return
+        layouts = list()
+        for keys, signatures in zip(self.__layouts, self.__signatures):
+            layout = array.array("I", [self.__get_column(key) for key in keys])
+            for signature in signatures:
+                for column, _type in zip(layout, signature):
+                    self.__types[column].add(_type)
+            layouts.append(layout.tobytes())
+        marshal.dump((self.__new_columns, layouts, self.__rows), self.__io_obj)
+        self.__new_columns = list()
+        self.__layouts = dict()
+        self.__signatures = list()
+        self.__rows = list()
+
+    def get_types(self) -> typing.Dict[str, typing.Set[type]]:
+        return {key: self.__types[column] for key, column in self.__columns.items()}
+
+
+def read_spill(io_obj: typing.BinaryIO):
+    columns = list()
+    while True:
+        try:
+            new_columns, layouts, rows = marshal.load(io_obj)
+        except EOFError:
+            break
+        columns.extend(new_columns)
+        yield columns, layouts, rows
+
+
+class ConcatReader:
+    def __init__(self, segments: typing.Sequence[typing.Tuple[str, int, int]], start: int = 0, length: typing.Optional[int] = None):
+        self.__segments = list(segments)
+        self.__remaining = sum(segment[2] for segment in self.__segments) - start
+        if length is not None:
+            self.__remaining = min(self.__remaining, length)
+        self.__index = 0
+        self.__pos = start
+        while self.__index < len(self.__segments) and self.__pos >= self.__segments[self.__index][2]:
+            self.__pos -= self.__segments[self.__index][2]
+            self.__index += 1
+        self.__file: typing.Optional[typing.BinaryIO] = None
+
+    def __read(self, size: int) -> bytes:
+        path, offset, length = self.__segments[self.__index]
+        if not self.__file:
+            self.__file = open(path, "rb")
+            self.__file.seek(offset + self.__pos)
+        data = self.__file.read(min(size, self.__remaining, length - self.__pos))
+        if not data:
+            raise EOFError("unexpected end of '{}'".format(path))
+        self.__pos += len(data)
+        self.__remaining -= len(data)
+        if self.__pos >= length:
+            self.__file.close()
+            self.__file = None
+            self.__pos = 0
+            self.__index += 1
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(65536), b""))
+        if self.__remaining <= 0 or size == 0:
+            return b""
+        return self.__read(size)
+
+    def close(self):
+        if self.__file:
+            self.__file.close()
+            self.__file = None
+
+
+class Progress:
+    def __init__(self, callback: typing.Optional[typing.Callable[[dict], None]] = None, interval: float = 1.0):
+        self.__callback = callback
+        self.__interval = interval
+        self.__start = time.time()
+        self.__last_report = 0.0
+        self.__phases = dict()
+        self.__phase = None
+        self.__phase_start = None
+        self.__fraction = None
+        self.rows = 0
+        self.bytes = 0
+
+    def __end_phase(self, now: float):
+        if self.__phase:
+            self.__phases[self.__phase] = self.__phases.get(self.__phase, 0.0) + now - self.__phase_start
+
+    def __report(self, force: bool = False):
+        if not self.__callback:
+            return
+        now = time.time()
+        if force or now - self.__last_report >= self.__interval:
+            self.__last_report = now
+            self.__callback(self.get())
+
+    def phase(self, name: str):
+        now = time.time()
+        self.__end_phase(now)
+        self.__phase = name
+        self.__phase_start = now
+        self.__fraction = None
+        self.__report(force=True)
+
+    def update(self, rows: int = 0, bytes: int = 0, fraction: typing.Optional[float] = None):
+        self.rows += rows
+        self.bytes += bytes
+        if fraction is not None:
+            self.__fraction = fraction
+        self.__report()
+
+    def finish(self):
+        self.__end_phase(time.time())
+        self.__phase = None
+        self.__report(force=True)
+
+    def get(self) -> dict:
+        now = time.time()
+        phases = dict(self.__phases)
+        eta = None
+        if self.__phase:
+            elapsed = now - self.__phase_start
+            phases[self.__phase] = phases.get(self.__phase, 0.0) + elapsed
+            if self.__fraction:
+                eta = round(elapsed * (1 - self.__fraction) / self.__fraction, 3)
+        fetch_time = phases.get("fetch")
+        render_time = phases.get("render")
+        return dict(
+            phase=self.__phase,
+            rows=self.rows,
+            bytes=self.bytes,
+            elapsed=round(now - self.__start, 3),
+            phases={key: round(value, 3) for key, value in phases.items()},
+            rows_per_second=round(self.rows / fetch_time, 1) if fetch_time else None,
+            bytes_per_second=round(self.bytes / render_time, 1) if render_time else None,
+            eta=eta
+        )
+
+
+class PageSize:
+    def __init__(self, initial: int, minimum: int, maximum: int, target_seconds: float, max_bytes: int):
+        self.__minimum = max(minimum, 1)
+        self.__maximum = max(maximum, self.__minimum)
+        self.__target_seconds = target_seconds
+        self.__max_bytes = max_bytes
+        self.size = min(max(initial, self.__minimum), self.__maximum)
+
+    def update(self, rows: int, seconds: float, bytes: int):
+        if rows <= 0:
+            return
+        limits = list()
+        if self.__target_seconds > 0 and seconds > 0:
+            limits.append(rows * self.__target_seconds / seconds)
+        if self.__max_bytes > 0 and bytes > 0:
+            limits.append(rows * self.__max_bytes / bytes)
+        if limits:
+            size = min(max(min(limits), self.size / 2), self.size * 2)
+            self.size = int(min(max(size, self.__minimum), self.__maximum))
+
+    @property
+    def adaptive(self) -> bool:
+        return self.__target_seconds > 0 or self.__max_bytes > 0
+
+    def shrink(self) -> bool:
+        if not self.adaptive or self.size <= self.__minimum:
+            return False
+        self.__maximum = max(self.size * 3 // 4, self.__minimum)
+        self.size = max(self.size // 2, self.__minimum)
+        return True
+
+
+whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(chunks: typing.Iterable[bytes]) -> typing.Iterator:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = str()
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    break
+                started = True
+                pos += 1
+            elif buffer[pos] == ",":
+                pos += 1
+            elif buffer[pos] == "]":
+                return
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break
+                if end >= len(buffer):
+                    break
+                pos = end
+                yield value
+    buffer = buffer[pos:] + text_decoder.decode(bytes(), final=True)
+    if started:
+        raise ValueError("incomplete JSON array")
+    value = json.loads(buffer) if buffer.strip() else None
+    if value is not None:
+        if not isinstance(value, list):
+            raise ValueError("expected JSON array")
+        yield from value
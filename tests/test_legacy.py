@@ -0,0 +1,69 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider import handlers, api
+from benchmark.fake_api import Source, FakeAPI
+from tests import util
+import falcon.testing
+import datetime
+import tempfile
+import unittest
+import shutil
+import os
+
+
+def hourly(measurement: str, start: datetime.datetime) -> Source:
+    return Source(source_id="src", measurement=measurement, rows=48, columns=5, sparsity=0.3, interval=3600, start=start)
+
+
+class TestLegacyFileInfo(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fake_api = FakeAPI(sources=[hourly("m1", datetime.datetime(2021, 1, 1))])
+        self.fake_api.start()
+        self.data_handler = util.make_data(fake_api=self.fake_api, path=self.path)
+        self.db_handler = handlers.DB(st_path=os.path.join(self.path, "db"))
+        data_item = self.data_handler.create(util.make_data_item("src"))
+        data_item.file_info = None
+        self.fake_api.add(hourly("m2", datetime.datetime(2021, 6, 1)))
+        self.data_item = self.data_handler.update(data_item)
+        with self.db_handler.batch() as batch:
+            handlers.store_data_item(batch, self.data_item)
+
+    def tearDown(self):
+        self.db_handler.close()
+        self.fake_api.stop()
+        shutil.rmtree(self.path)
+
+    def test_checksum_does_not_index_legacy_files(self):
+        self.assertEqual(len(self.data_item.files), 2)
+        self.assertNotIn(self.data_item.files[0], self.data_item.file_info)
+        self.assertFalse(handlers.is_indexed(self.data_item))
+        with self.assertRaises(RuntimeError):
+            self.data_handler.query(self.data_item)
+
+    def test_api_conflict(self):
+        data_cache = handlers.DataCache(db_handler=self.db_handler, size=10)
+        app = falcon.App()
+        app.add_route("/data/{source_id}/csv", api.CSVStream(data_cache=data_cache, data_handler=self.data_handler))
+        app.add_route("/data/{source_id}/query", api.Query(data_cache=data_cache, data_handler=self.data_handler))
+        client = falcon.testing.TestClient(app)
+        self.assertEqual(client.simulate_get("/data/src/csv").status, falcon.HTTP_409)
+        self.assertEqual(client.simulate_get("/data/src/query").status, falcon.HTTP_409)
+
+
+if __name__ == "__main__":
+    unittest.main()
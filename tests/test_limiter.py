@@ -0,0 +1,102 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider.handlers.upstream import Limiter, is_overload
+import requests
+import multiprocessing
+import threading
+import unittest
+import time
+import os
+
+
+def hold(limiter: Limiter, active, peak, count: int):
+    for _ in range(count):
+        slot = limiter.acquire()
+        with active.get_lock():
+            active.value += 1
+            peak.value = max(peak.value, active.value)
+        time.sleep(0.01)
+        with active.get_lock():
+            active.value -= 1
+        limiter.release(slot=slot, seconds=0.01, overload=False)
+
+
+class TestLimiter(unittest.TestCase):
+    def test_concurrency_across_processes(self):
+        limiter = Limiter(concurrency=3, rate=0, latency=0)
+        active = multiprocessing.Value("i", 0)
+        peak = multiprocessing.Value("i", 0)
+        processes = [multiprocessing.Process(target=hold, args=(limiter, active, peak, 5)) for _ in range(6)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(peak.value, 3)
+
+    def test_rate(self):
+        limiter = Limiter(concurrency=0, rate=50, latency=0)
+        start = time.monotonic()
+        for _ in range(75):
+            limiter.release(slot=limiter.acquire(), seconds=0, overload=False)
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+    def test_adaptation(self):
+        limiter = Limiter(concurrency=4, rate=0, latency=0.5)
+        limiter.release(slot=limiter.acquire(), seconds=1.0, overload=False)
+        slots = [limiter.acquire(), limiter.acquire()]
+        waiter = threading.Thread(target=lambda: slots.append(limiter.acquire()))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+        limiter.release(slot=slots.pop(0), seconds=0.1, overload=False)
+        waiter.join(2)
+        self.assertFalse(waiter.is_alive())
+        for slot in slots:
+            limiter.release(slot=slot, seconds=0.1, overload=False)
+        for _ in range(10):
+            limiter.release(slot=limiter.acquire(), seconds=0.1, overload=False)
+        slots = list()
+        waiter = threading.Thread(target=lambda: slots.extend(limiter.acquire() for _ in range(4)))
+        waiter.start()
+        waiter.join(2)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(sorted(slots), [0, 1, 2, 3])
+
+    def test_reclaim_slot_of_exited_process(self):
+        limiter = Limiter(concurrency=1, rate=0, latency=0)
+        process = multiprocessing.Process(target=lambda: (limiter.acquire(), os._exit(0)))
+        process.start()
+        process.join()
+        start = time.monotonic()
+        limiter.release(slot=limiter.acquire(), seconds=0, overload=False)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class TestOverload(unittest.TestCase):
+    def test_classification(self):
+        self.assertTrue(is_overload(RuntimeError(503), 503))
+        self.assertTrue(is_overload(RuntimeError(429), 429))
+        self.assertFalse(is_overload(RuntimeError(400), 400))
+        self.assertFalse(is_overload(RuntimeError(401), 401))
+        self.assertTrue(is_overload(requests.exceptions.ReadTimeout(), None))
+        self.assertTrue(is_overload(requests.exceptions.ConnectTimeout(), None))
+        self.assertTrue(is_overload(requests.exceptions.ConnectionError(), None))
+        self.assertFalse(is_overload(KeyError("token"), None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider import util, models
+from csv_provider.handlers import data
+import datetime
+import tempfile
+import unittest
+import shutil
+import os
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class TestRenderTable(unittest.TestCase):
+    time_format = "%Y-%m-%dT%H:%M:%S.%fZ"
+    rows = [
+        ("2021-01-01T00:00:00.000000Z", {"a": 1, "b": "x"}),
+        ("2021-01-01T00:00:01.250000Z", {"b": "y"}),
+        ("2021-01-01T01:00:00.000000Z", {"a": 2})
+    ]
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.chunk_path = os.path.join(self.path, "chunk")
+        with open(self.chunk_path, "wb") as file:
+            writer = util.SpillWriter(file, batch_size=2)
+            for timestamp, values in self.rows:
+                writer.write(timestamp, values)
+            writer.flush()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def render(self, file_format: str):
+        file_path = os.path.join(self.path, file_format)
+        info = data.render_table_chunk(
+            self.chunk_path,
+            file_path,
+            None,
+            columns=["time", "a", "b"],
+            column_types={"time": models.ColumnType.timestamp, "a": models.ColumnType.integer},
+            default_values=dict(),
+            time_format=self.time_format,
+            file_format=file_format,
+            codec=None,
+            compression_level=-1
+        )
+        self.assertEqual((info["first"], info["last"]), (self.rows[0][0], self.rows[-1][0]))
+        if file_format == models.FileFormat.parquet:
+            return pyarrow.parquet.read_table(file_path)
+        with pyarrow.memory_map(file_path) as source:
+            return pyarrow.ipc.open_file(source).read_all()
+
+    def test_time_column(self):
+        for file_format in (models.FileFormat.parquet, models.FileFormat.arrow):
+            table = self.render(file_format)
+            self.assertEqual(table.schema.field("time").type, pyarrow.timestamp("us", tz="UTC"), file_format)
+            self.assertEqual(
+                table.column("time").to_pylist(),
+                [datetime.datetime.strptime(timestamp, self.time_format).replace(tzinfo=datetime.timezone.utc) for timestamp, _ in self.rows],
+                file_format
+            )
+            self.assertEqual(table.column("a").to_pylist(), [1, None, 2], file_format)
+            self.assertEqual(table.column("b").to_pylist(), ["x", "y", None], file_format)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from benchmark.fake_api import Source, FakeAPI
+from tests import util
+import datetime
+import tempfile
+import unittest
+import shutil
+
+
+def hourly(measurement: str, start: datetime.datetime, rows: int) -> Source:
+    return Source(source_id="src", measurement=measurement, rows=rows, columns=5, sparsity=0.3, interval=3600, start=start)
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fake_api = FakeAPI(sources=[hourly("m1", datetime.datetime(2020, 12, 30), 24)])
+        self.fake_api.start()
+        self.data_handler = util.make_data(fake_api=self.fake_api, path=self.path)
+
+    def tearDown(self):
+        self.fake_api.stop()
+        shutil.rmtree(self.path)
+
+    def assertDisjoint(self, sources: dict):
+        years = [set(source["year_map"].values()) for source in sources.values()]
+        self.assertEqual(len(set.union(*years)), sum(len(x) for x in years))
+
+    def test_new_source_and_extended_source(self):
+        data_item = self.data_handler.create(util.make_data_item("src"))
+        self.assertEqual(data_item.sources["m1"]["year_map"], {"2020": "1970"})
+        self.fake_api.add(hourly("m0", datetime.datetime(2021, 1, 2), 24))
+        self.fake_api.add(hourly("m1", datetime.datetime(2020, 12, 30), 96))
+        data_item = self.data_handler.update(data_item)
+        self.assertDisjoint(data_item.sources)
+        self.assertEqual(data_item.sources["m1"]["year_map"], {"2020": "1970", "2021": "1971"})
+        self.assertEqual(data_item.sources["m0"]["year_map"], {"2021": "1972"})
+
+    def test_update_matches_create(self):
+        self.fake_api.add(hourly("m1", datetime.datetime(2021, 1, 1), 96))
+        self.fake_api.add(hourly("m2", datetime.datetime(2021, 5, 1), 96))
+        data_item = self.data_handler.create(util.make_data_item("src"))
+        self.fake_api.add(hourly("m1", datetime.datetime(2021, 1, 1), 144))
+        self.fake_api.add(hourly("m2", datetime.datetime(2021, 5, 1), 144))
+        self.fake_api.add(hourly("m3", datetime.datetime(2021, 2, 1), 24))
+        data_item = self.data_handler.update(data_item)
+        self.assertDisjoint(data_item.sources)
+        firsts = [data_item.file_info[file]["first"] for file in data_item.files]
+        self.assertEqual(firsts, sorted(firsts))
+        full_item = self.data_handler.create(util.make_data_item("src"))
+        self.assertEqual(data_item.size, full_item.size)
+        self.assertEqual(b"".join(self.data_handler.query(data_item)), b"".join(self.data_handler.query(full_item)))
+
+    def test_legacy_files_are_rebuilt(self):
+        data_item = self.data_handler.create(util.make_data_item("src"))
+        for file_info in data_item.file_info.values():
+            del file_info["first"]
+        self.fake_api.add(hourly("m1", datetime.datetime(2020, 12, 30), 48))
+        old_files = set(data_item.files)
+        data_item = self.data_handler.update(data_item)
+        self.assertFalse(old_files & set(data_item.files))
+        self.assertTrue(all(file_info.get("first") for file_info in data_item.file_info.values()))
+
+if __name__ == "__main__":
+    unittest.main()
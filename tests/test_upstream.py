@@ -0,0 +1,101 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider import handlers
+from benchmark import fake_api
+from tests import util
+import requests
+import unittest.mock
+import unittest
+import tempfile
+import datetime
+import shutil
+import time
+
+
+class TestTimeout(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fake_api = fake_api.FakeAPI(sources=[fake_api.Source(source_id="src", measurement="m1", rows=500, columns=5, sparsity=0.3, start=datetime.datetime(2021, 1, 1))])
+        self.fake_api.start()
+        self.stalled = 0
+
+    def tearDown(self):
+        self.fake_api.stop()
+        shutil.rmtree(self.path)
+
+    def test_stalled_responses_are_retried(self):
+        do_post = fake_api.Handler.do_POST
+
+        def stall(handler):
+            if self.stalled >= 2:
+                return do_post(handler)
+            self.stalled += 1
+            handler.rfile.read(int(handler.headers["Content-Length"]))
+            handler.send_response(200)
+            handler.send_header("Content-Length", "100000")
+            handler.end_headers()
+            handler.wfile.write(b"[")
+            handler.wfile.flush()
+            time.sleep(3)
+
+        upstream_handler = handlers.Upstream(
+            auth_handler=util.StaticAuth(),
+            usr_id="test",
+            pool_size=2,
+            retries=2,
+            backoff=0.01,
+            backoff_max=0.1,
+            token_ttl=60,
+            connect_timeout=1.0,
+            read_timeout=0.5,
+            limiter=None
+        )
+        data_handler = util.make_data(fake_api=self.fake_api, path=self.path, upstream_handler=upstream_handler)
+        with unittest.mock.patch.object(fake_api.Handler, "do_POST", stall):
+            start = time.monotonic()
+            data_item = data_handler.create(util.make_data_item("src"))
+        self.assertEqual(self.stalled, 2)
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(b"".join(data_handler.query(data_item)).count(b"\n"), 501)
+
+    def test_timed_out_requests_release_slots(self):
+        def hang(handler):
+            time.sleep(3)
+
+        limiter = handlers.Limiter(concurrency=1, rate=0, latency=0)
+        upstream_handler = handlers.Upstream(
+            auth_handler=util.StaticAuth(),
+            usr_id="test",
+            pool_size=2,
+            retries=1,
+            backoff=0.01,
+            backoff_max=0.1,
+            token_ttl=60,
+            connect_timeout=1.0,
+            read_timeout=0.5,
+            limiter=limiter
+        )
+        with unittest.mock.patch.object(fake_api.Handler, "do_POST", hang):
+            with self.assertRaises(requests.exceptions.Timeout):
+                upstream_handler.request(name="db_api", method="POST", url=self.fake_api.url, limited=True, json=[dict()])
+        start = time.monotonic()
+        limiter.release(slot=limiter.acquire(), seconds=0, overload=False)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
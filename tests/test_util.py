@@ -0,0 +1,175 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider import util
+import contextlib
+import array
+import io
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+
+def split(data: bytes, size: int) -> list:
+    return [data[x:x + size] for x in range(0, len(data), size)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+    rows = [
+        ["2021-01-01T00:00:00.000000Z", "{\"a\": 1.5, \"b\": \"ä€\"}", "{}"],
+        ["2021-01-01T00:01:00.000000Z", None, [1, 2, {"c": True}]],
+        [123456789, -0.25e-3, "]", ","]
+    ]
+
+    def test_chunk_sizes(self):
+        data = json.dumps(self.rows, ensure_ascii=False).encode()
+        for size in range(1, len(data) + 1):
+            self.assertEqual(list(util.iter_json_array(split(data, size))), self.rows, size)
+
+    def test_number_at_chunk_end(self):
+        self.assertEqual(list(util.iter_json_array([b"[1", b"2", b"3,4", b"5]"])), [123, 45])
+
+    def test_whitespace_and_empty(self):
+        self.assertEqual(list(util.iter_json_array([b" \n[ ", b"1 , 2 ", b"]\n"])), [1, 2])
+        self.assertEqual(list(util.iter_json_array([b"[]"])), list())
+        self.assertEqual(list(util.iter_json_array([b"null"])), list())
+        self.assertEqual(list(util.iter_json_array(list())), list())
+
+    def test_incomplete(self):
+        values = list()
+        with self.assertRaises(ValueError):
+            for value in util.iter_json_array([b"[[1], [2], [3"]):
+                values.append(value)
+        self.assertEqual(values, [[1], [2]])
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            list(util.iter_json_array([b'{"a": ', b"1}"]))
+
+
+class TestPageSize(unittest.TestCase):
+    def test_fixed(self):
+        page_size = util.PageSize(initial=1000, minimum=100, maximum=10000, target_seconds=0, max_bytes=0)
+        page_size.update(rows=1000, seconds=60, bytes=10 ** 9)
+        self.assertEqual(page_size.size, 1000)
+        self.assertFalse(page_size.adaptive)
+        self.assertFalse(page_size.shrink())
+        self.assertEqual(page_size.size, 1000)
+
+    def test_initial_bounds(self):
+        self.assertEqual(util.PageSize(initial=10, minimum=100, maximum=1000, target_seconds=1, max_bytes=0).size, 100)
+        self.assertEqual(util.PageSize(initial=5000, minimum=100, maximum=1000, target_seconds=1, max_bytes=0).size, 1000)
+
+    def test_target_seconds(self):
+        page_size = util.PageSize(initial=1000, minimum=100, maximum=10000, target_seconds=1, max_bytes=0)
+        page_size.update(rows=1000, seconds=1.25, bytes=0)
+        self.assertEqual(page_size.size, 800)
+        page_size.update(rows=800, seconds=20, bytes=0)
+        self.assertEqual(page_size.size, 400)
+        page_size.update(rows=400, seconds=0.01, bytes=0)
+        self.assertEqual(page_size.size, 800)
+        page_size.update(rows=0, seconds=0, bytes=0)
+        self.assertEqual(page_size.size, 800)
+
+    def test_max_bytes(self):
+        page_size = util.PageSize(initial=1000, minimum=100, maximum=1500, target_seconds=1, max_bytes=1000000)
+        page_size.update(rows=1000, seconds=0.5, bytes=800000)
+        self.assertEqual(page_size.size, 1250)
+        page_size.update(rows=1250, seconds=0.1, bytes=100000)
+        self.assertEqual(page_size.size, 1500)
+
+    def test_shrink(self):
+        page_size = util.PageSize(initial=1000, minimum=300, maximum=10000, target_seconds=1, max_bytes=0)
+        self.assertTrue(page_size.shrink())
+        self.assertEqual(page_size.size, 500)
+        page_size.update(rows=500, seconds=0.1, bytes=0)
+        self.assertEqual(page_size.size, 750)
+        self.assertTrue(page_size.shrink())
+        self.assertEqual(page_size.size, 375)
+        self.assertTrue(page_size.shrink())
+        self.assertEqual(page_size.size, 300)
+        self.assertFalse(page_size.shrink())
+
+
+class TestSpill(unittest.TestCase):
+    rows = [
+        ("t0", {"a": 1, "b": "x"}),
+        ("t1", {"b": "y", "c": 2.5}),
+        ("t2", {"a": 2, "b": "z"}),
+        ("t3", {"d": None}),
+        ("t4", {"a": 1.5, "c": 3.0, "d": True})
+    ]
+
+    def test_round_trip(self):
+        for batch_size in (1, 2, len(self.rows) + 1):
+            io_obj = io.BytesIO()
+            writer = util.SpillWriter(io_obj, batch_size=batch_size)
+            for timestamp, data in self.rows:
+                writer.write(timestamp, data)
+            writer.flush()
+            io_obj.seek(0)
+            rows = list()
+            for columns, layouts, batch in util.read_spill(io_obj):
+                self.assertLessEqual(len(layouts), batch_size)
+                for layout, timestamp, values in batch:
+                    rows.append((timestamp, dict(zip((columns[column] for column in array.array("I", layouts[layout])), values))))
+            self.assertEqual(rows, self.rows, batch_size)
+            self.assertEqual(writer.get_types(), {"a": {int, float}, "b": {str}, "c": {float}, "d": {type(None), bool}})
+
+
+class TestConcatReader(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.segments = list()
+        self.expected = bytes()
+        for x, (content, offset) in enumerate(((b"head\nabcdefghij", 0), (b"head\nklmnop", 5), (b"head\nqrstuvwxyz", 5))):
+            file_path = os.path.join(self.path, str(x))
+            with open(file_path, "wb") as file:
+                file.write(content)
+            self.segments.append((file_path, offset, len(content) - offset))
+            self.expected += content[offset:]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read_all(self):
+        with contextlib.closing(util.ConcatReader(self.segments)) as reader:
+            self.assertEqual(reader.read(), self.expected)
+            self.assertEqual(reader.read(), bytes())
+
+    def test_read_sizes(self):
+        for size in range(1, len(self.expected) + 2):
+            with contextlib.closing(util.ConcatReader(self.segments)) as reader:
+                self.assertEqual(b"".join(iter(lambda: reader.read(size), b"")), self.expected, size)
+
+    def test_ranges(self):
+        for start in range(len(self.expected)):
+            for length in (1, 4, 11, len(self.expected)):
+                with contextlib.closing(util.ConcatReader(self.segments, start=start, length=length)) as reader:
+                    self.assertEqual(reader.read(), self.expected[start:start + length], (start, length))
+
+    def test_truncated_file(self):
+        path, offset, length = self.segments[1]
+        self.segments[1] = (path, offset, length + 5)
+        with contextlib.closing(util.ConcatReader(self.segments)) as reader:
+            with self.assertRaises(EOFError):
+                reader.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
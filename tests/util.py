@@ -0,0 +1,75 @@
+"""
+   Copyright 2021 InfAI (CC SES)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from csv_provider import handlers, models
+from benchmark.fake_api import FakeAPI
+from benchmark.run import StaticAuth
+import os
+
+
+def make_data(fake_api: FakeAPI, path: str, **kwargs) -> handlers.Data:
+    for directory in ("data", "tmp"):
+        os.makedirs(os.path.join(path, directory), exist_ok=True)
+    args = dict(
+        upstream_handler=handlers.Upstream(
+            auth_handler=StaticAuth(),
+            usr_id="test",
+            pool_size=2,
+            retries=0,
+            backoff=0.0,
+            backoff_max=0.0,
+            token_ttl=60,
+            connect_timeout=5.0,
+            read_timeout=30.0,
+            limiter=None
+        ),
+        data_path=os.path.join(path, "data"),
+        tmp_path=os.path.join(path, "tmp"),
+        db_api_url=fake_api.url,
+        export_api_url=fake_api.url,
+        time_format="%Y-%m-%dT%H:%M:%S.%fZ",
+        db_api_time_format="2006-01-02T15:04:05.000000Z07:00",
+        start_year=1970,
+        chunk_size=1000,
+        chunk_size_min=100,
+        chunk_size_max=10000,
+        page_seconds=0.0,
+        page_bytes=0,
+        file_rows=0,
+        file_size=0,
+        file_period=None,
+        compression=True,
+        codec=models.Codec.gzip,
+        compression_level=-1,
+        compression_threads=0,
+        single_header=False,
+        fetch_workers=2,
+        fetch_buffer=2,
+        fetch_batch=100,
+        render_workers=1,
+        float_precision=-1,
+        index_interval=100
+    )
+    args.update(kwargs)
+    return handlers.Data(**args)
+
+
+def make_data_item(source_id: str) -> models.DataItem:
+    data_item = models.DataItem()
+    data_item.source_id = source_id
+    data_item.time_field = "time"
+    data_item.delimiter = ","
+    return data_item